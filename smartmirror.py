@@ -3,6 +3,10 @@ import random
 import json
 import importlib
 
+# Each tensorflow session of the widgets owns its thread pools, see `widgets.exercisor.backends`.
+# Tensorflow reads it once, so it is set before any widget is imported
+os.environ.setdefault("TF_OVERRIDE_GLOBAL_THREADPOOL", "1")
+
 from kivy.app import App
 from kivy.clock import mainthread
 from kivy.core.window import Window
@@ -0,0 +1,174 @@
+"""
+Compares the NumPy SMPL with a direct port of the original sequential
+batch_smpl and batch_global_rigid_transformation, on a small synthetic SMPL model.
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+import scipy.sparse
+
+from widgets.exercisor.tf_smpl.np_lbs import batch_global_rigid_transformation
+from widgets.exercisor.tf_smpl.np_smpl import NumpySMPL
+
+NUM_VERTS = 300
+POSEDIRS_RANK = 20
+PARENTS = np.array(
+    [-1, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 9, 9, 12, 13, 14, 16, 17, 18, 19, 20, 21]
+)
+
+
+def _sparse_regressor(rng, num_joints, num_used):
+    """Returns a joint regressor that averages num_used random vertices per joint."""
+    regressor = np.zeros((num_joints, NUM_VERTS))
+    for joint in range(num_joints):
+        indices = rng.choice(NUM_VERTS, num_used, replace=False)
+        weights = rng.random(num_used)
+        regressor[joint, indices] = weights / weights.sum()
+    return scipy.sparse.csc_matrix(regressor)
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """A synthetic SMPL model, with low-rank pose blend shapes and at most four joints per vertex."""
+    rng = np.random.default_rng(0)
+    weights = np.zeros((NUM_VERTS, 24))
+    for vertex in range(NUM_VERTS):
+        joints = rng.choice(24, 4, replace=False)
+        weights[vertex, joints] = rng.random(4)
+    weights /= weights.sum(axis=1, keepdims=True)
+    posedirs = rng.normal(scale=0.01, size=(NUM_VERTS * 3, POSEDIRS_RANK)) @ rng.normal(
+        size=(POSEDIRS_RANK, 207)
+    )
+
+    dd = {
+        "v_template": rng.normal(scale=0.3, size=(NUM_VERTS, 3)),
+        "shapedirs": rng.normal(scale=0.01, size=(NUM_VERTS, 3, 10)),
+        "J_regressor": _sparse_regressor(rng, 24, 10),
+        "posedirs": posedirs.reshape(NUM_VERTS, 3, 207),
+        "kintree_table": np.stack([PARENTS, np.arange(24)]),
+        "weights": weights,
+        "cocoplus_regressor": _sparse_regressor(rng, 19, 30),
+        "f": np.zeros((10, 3), dtype=np.int32),
+    }
+    path = tmp_path_factory.mktemp("smpl") / "smpl.pkl"
+    with open(path, "wb") as f:
+        pickle.dump(dd, f)
+    return str(path), dd
+
+
+def _rodrigues(theta):
+    """The rotation matrices of the N x 3 axis-angle vectors."""
+    angle = np.linalg.norm(theta, axis=1)[:, None, None]
+    axis = theta / np.maximum(angle[:, :, 0], 1e-12)
+    skew = np.zeros((len(theta), 3, 3))
+    skew[:, 0, 1], skew[:, 0, 2], skew[:, 1, 2] = -axis[:, 2], axis[:, 1], -axis[:, 0]
+    skew -= skew.transpose(0, 2, 1)
+    outer = axis[:, :, None] * axis[:, None, :]
+    return (
+        np.cos(angle) * np.eye(3) + (1 - np.cos(angle)) * outer + np.sin(angle) * skew
+    )
+
+
+def _rigid_transformation(Rs, Js):
+    """The original sequential forward kinematics, joint after joint."""
+    N = len(Rs)
+    results = np.zeros((N, 24, 4, 4))
+    for i in range(24):
+        local = np.tile(np.eye(4), (N, 1, 1))
+        local[:, :3, :3] = Rs[:, i]
+        local[:, :3, 3] = Js[:, i] - (Js[:, PARENTS[i]] if i > 0 else 0)
+        results[:, i] = local if i == 0 else results[:, PARENTS[i]] @ local
+    A = results.copy()
+    A[:, :, :3, 3] -= np.einsum("njab,njb->nja", results[:, :, :3, :3], Js)
+    return results[:, :, :3, 3], A
+
+
+def _reference(dd, beta, theta):
+    """The original batch_smpl, in float64."""
+    N = len(beta)
+    v_shaped = (beta @ dd["shapedirs"].reshape(-1, 10).T).reshape(N, NUM_VERTS, 3)
+    v_shaped += dd["v_template"]
+    J = np.einsum("nvc,jv->njc", v_shaped, dd["J_regressor"].toarray())
+    Rs = _rodrigues(theta.reshape(-1, 3)).reshape(N, 24, 3, 3)
+    pose_feature = (Rs[:, 1:] - np.eye(3)).reshape(N, 207)
+    v_posed = (pose_feature @ dd["posedirs"].reshape(-1, 207).T).reshape(
+        N, NUM_VERTS, 3
+    )
+    v_posed += v_shaped
+    J_transformed, A = _rigid_transformation(Rs, J)
+    T = np.einsum("vj,njab->nvab", dd["weights"], A)
+    verts = np.einsum("nvab,nvb->nva", T[:, :, :3, :3], v_posed) + T[:, :, :3, 3]
+    joints = np.einsum("nvc,jv->njc", verts, dd["cocoplus_regressor"].toarray())
+    return verts, joints, J_transformed
+
+
+def _inputs(num_frames, same_beta=False, seed=1):
+    rng = np.random.default_rng(seed)
+    beta = rng.normal(size=(1 if same_beta else num_frames, 10))
+    theta = rng.normal(scale=0.5, size=(num_frames, 72))
+    return np.repeat(beta, num_frames // len(beta), axis=0), theta
+
+
+def _assert_matches(actual, expected):
+    for a, e in zip(actual, expected):
+        np.testing.assert_allclose(a, e, rtol=0, atol=1e-6)
+
+
+def test_matches_original(model):
+    path, dd = model
+    beta, theta = _inputs(8)
+    _assert_matches(
+        NumpySMPL(path)(beta, theta, get_skin=True), _reference(dd, beta, theta)
+    )
+
+
+def test_level_forward_kinematics():
+    rng = np.random.default_rng(2)
+    Rs = _rodrigues(rng.normal(size=(5 * 24, 3))).reshape(5, 24, 3, 3)
+    Js = rng.normal(size=(5, 24, 3))
+    for actual, expected in zip(
+        batch_global_rigid_transformation(Rs, Js, PARENTS),
+        _rigid_transformation(Rs, Js),
+    ):
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-10)
+
+
+def test_low_rank_posedirs(model):
+    path, dd = model
+    beta, theta = _inputs(8)
+    # The pose blend shapes of the model have exactly that rank
+    smpl = NumpySMPL(path, posedirs_rank=POSEDIRS_RANK)
+    assert smpl.posedirs_factors is not None
+    _assert_matches(smpl(beta, theta, get_skin=True), _reference(dd, beta, theta))
+
+
+def test_topk_skinning(model):
+    path, dd = model
+    beta, theta = _inputs(8)
+    # Every vertex of the model is influenced by four joints
+    smpl = NumpySMPL(path, skinning_k=4)
+    assert smpl.skinning_topk is not None
+    _assert_matches(smpl(beta, theta, get_skin=True), _reference(dd, beta, theta))
+
+
+@pytest.mark.parametrize("same_beta", [True, False])
+def test_shape_cache(model, same_beta):
+    path, dd = model
+    beta, theta = _inputs(8, same_beta)
+    smpl = NumpySMPL(path)
+    for _ in range(2):
+        _assert_matches(smpl(beta, theta, get_skin=True), _reference(dd, beta, theta))
+    assert len(smpl._shape_cache) == (1 if same_beta else smpl.shape_cache_size)
+
+
+def test_posed_joints(model):
+    path, dd = model
+    beta, theta = _inputs(8, same_beta=True)
+    np.testing.assert_allclose(
+        NumpySMPL(path).posed_joints(beta, theta),
+        _reference(dd, beta, theta)[2],
+        rtol=0,
+        atol=1e-6,
+    )
@@ -128,7 +128,9 @@ class PlaybackAction(AbstractAction):
         self.renderer.single_click_handle = self.single_click_handle
         self.keypoints_spec = keypoints_spec
 
-    def initialize(self, smpl_mode: Text, exercise: np.ndarray = None):
+    def initialize(
+        self, smpl_mode: Text, exercise: np.ndarray = None, exercise_name: Text = None
+    ):
         """Set the SMPL thread's output function and the exercise data to use as input.
 
         Extends the :method:`initialize` of the :class:`AbstractAction`.
@@ -137,13 +139,26 @@ class PlaybackAction(AbstractAction):
          ----------
          exercise : `numpy.array`, (N x 82)
              The SMPL's 82 thetas parameters of each of the N frames.
+         exercise_name : `str`
+             The name of the exercise, under which its geometry is cached.
         """
         super().initialize(smpl_mode)
 
         self.smpl_thread.output_fn = self.render_mesh
+        self.smpl_thread.exercise_name = exercise_name
         self.exercise = exercise
         self.smpl_thread.frame_index = 0
 
+    def init_renderers(self, smpl_mode: Text):
+        """Request from the SMPL thread only the outputs that the :param: `smpl_mode` renders.
+
+        Extends the :method: `init_renderers` of the :class: `AbstractAction`.
+        """
+        super().init_renderers(smpl_mode)
+        self.smpl_thread.requested_outputs = (
+            {"vertices", "keypoints"} if smpl_mode == "smpl_mesh" else {"keypoints"}
+        )
+
     @property
     def exercise(self):
         """The current playbacked exercise's thetas.
@@ -256,14 +271,45 @@ class PredictAction(AbstractAction):
             The source of the video to use as input. It can be `cam` for camera input or a path to a local video file.
         save_exercise : `bool`
             Whether to save the predicted exercises' data.
+            The video file is then predicted offline, in the ingestion mode of the HMR thread.
         """
         super().initialize(smpl_mode)
 
         self.hmr_thread.output_fn = self.render_mesh
-        if source is not None:
-            self.hmr_thread.capture = source
         if save_exercise:
-            self.hmr_thread.save()
+            # The live predictions are not needed while ingesting the video
+            self.hmr_thread.pause()
+            self.hmr_thread.ingest(source, progress_fn=self.show_progress)
+        elif source is not None:
+            self.hmr_thread.capture = source
+        # The shape is collected again, since a new user may be in front of the mirror
+        self.hmr_thread.reset_shape()
+
+    def init_renderers(self, smpl_mode: Text):
+        """Request from the HMR thread only the outputs that the :param: `smpl_mode` renders.
+
+        Extends the :method: `init_renderers` of the :class: `AbstractAction`.
+        """
+        super().init_renderers(smpl_mode)
+        self.hmr_thread.requested_outputs = (
+            {"verts", "joints3d"} if smpl_mode == "smpl_mesh" else {"joints3d"}
+        )
+
+    @mainthread
+    def show_progress(self, nframes: int, total_frames: int):
+        """Display the progress of the exercise's ingestion.
+
+        Parameters
+        ----------
+        nframes : `int`
+            The number of frames processed so far.
+        total_frames : `int`
+            The total frames of the video, or 0 if it is not known.
+        """
+        if self.controls is None:
+            return
+        progress = f"{nframes}/{total_frames}" if total_frames else f"{nframes}"
+        self.controls.info_label.text = f"Saving the exercise: {progress} frames"
 
     @mainthread
     def render_mesh(
@@ -273,9 +319,10 @@ class PredictAction(AbstractAction):
         super().render_mesh(self.renderer, new_vertices, new_kpnts)
 
     def stop(self):
-        """Stop the action and pause the HMR thread."""
+        """Stop the action, pause the HMR thread and cancel any running ingestion."""
         super().stop()
         self.hmr_thread.pause()
+        self.hmr_thread.cancel_ingest()
 
     def pause(self):
         """Pause the action and the HMR thread"""
@@ -354,10 +401,12 @@ class PlayAction(AbstractAction):
         # Prepare the SMPL playback
         if thetas is not None:
             self._thetas = thetas
+            self.threads["smpl"].exercise_name = metadata.get("name")
             self.threads["smpl"].exercise = thetas
             self.threads["smpl"].frame_index = 0
         # Prepare the HMR predictions
         self.threads["hmr"].capture = "cam"
+        self.threads["hmr"].reset_shape()
 
         # Set up the progress counter depending on the exercise
         self.renderer.parent.add_widget(self._progress_counter)
@@ -383,13 +432,20 @@ class PlayAction(AbstractAction):
             self._progress_counter.counter = 10
 
     def init_renderers(self, smpl_mode: Text):
-        """Setups the :attr: `pred_renderer` with the opposite :param: `smpl_mode`.
+        """Setups the :attr: `pred_renderer` with the opposite :param: `smpl_mode`
+        and requests from the HMR and SMPL threads only the outputs that their renderers render.
 
         Extends the :method: `init_renderers` of the :class: `AbstractAction`.
         """
         super().init_renderers(smpl_mode)
-        self.pred_renderer.setup_scene(
-            "smpl_mesh" if smpl_mode == "smpl_kpnts" else "smpl_kpnts"
+        pred_mode = "smpl_mesh" if smpl_mode == "smpl_kpnts" else "smpl_kpnts"
+        self.pred_renderer.setup_scene(pred_mode)
+        # The scoring only needs the keypoints, so the mesh is predicted only when it is rendered
+        self.threads["hmr"].requested_outputs = (
+            {"verts", "joints3d"} if pred_mode == "smpl_mesh" else {"joints3d"}
+        )
+        self.threads["smpl"].requested_outputs = (
+            {"vertices", "keypoints"} if smpl_mode == "smpl_mesh" else {"keypoints"}
         )
 
     def _start_new_rep(self):
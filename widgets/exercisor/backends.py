@@ -0,0 +1,462 @@
+"""The inference backends that run the models of the :class: `ml_thread.MLThread` subclasses.
+
+Each backend wraps an execution engine behind the same interface, so that the engines can be compared
+on each device by changing the Exercisor settings. The engines are imported when a backend is loaded,
+so the backends that do not use tensorflow do not import it.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import os
+import sys
+
+import numpy as np
+
+from .utils.log import logger
+
+# Makes the CPU device of each tensorflow session own its intra-op thread pool
+PER_SESSION_POOL_VAR = "TF_OVERRIDE_GLOBAL_THREADPOOL"
+
+
+class InferenceBackend(ABC):
+    """The abstract execution engine of a model.
+
+    The backend is created on the main thread and loaded on the thread of the model,
+    which then calls :method: `predict` for each prediction.
+
+    Attributes
+    ----------
+    name : `str`
+        The name of the backend in the Exercisor settings.
+    """
+
+    name = None
+
+    @abstractmethod
+    def load(self):
+        """Load the model."""
+        pass
+
+    @abstractmethod
+    def predict(self, inputs, outputs=None):
+        """Run the model on a batch of inputs.
+
+        Parameters
+        ----------
+        inputs : `numpy.ndarray`
+            The batch of inputs of the model.
+        outputs : `iterable` [`str`], optional
+            The names of the outputs to compute. If `None`, all the outputs are computed.
+
+        Returns
+        -------
+        `dict` [`str`, `numpy.ndarray`]
+            The batch of each computed output.
+        """
+        pass
+
+    def close(self):
+        """Release the resources of the backend."""
+        pass
+
+
+def use_per_session_threads():
+    """Make every tensorflow session of the process create its own thread pools.
+
+    Tensorflow reads :data: `PER_SESSION_POOL_VAR` once, when it creates the first CPU device
+    of the process, so this is called at the startup of the mirror and of the command line tools,
+    before tensorflow is imported.
+    """
+    if "tensorflow" in sys.modules and os.environ.get(PER_SESSION_POOL_VAR) != "1":
+        logger.warning(
+            "Tensorflow was imported before its thread pools were made per session, "
+            "so its sessions may share the thread pool of the first one"
+        )
+    os.environ[PER_SESSION_POOL_VAR] = "1"
+
+
+def _create_session(intra_op_threads=0, inter_op_threads=0):
+    """Create a tensorflow graph and a session that runs it.
+
+    The thread pools of the session are sized with :param: `intra_op_threads` and :param: `inter_op_threads`,
+    or by tensorflow when they are 0.
+    By default, tensorflow creates both pools once per process, sized by the first session,
+    so every session gets its own pools instead, when the process has called :func: `use_per_session_threads`.
+    They are created with the session, so they inherit the CPU affinity of the thread that creates it.
+    """
+    if os.environ.get(PER_SESSION_POOL_VAR) != "1":
+        logger.warning(
+            "The tensorflow sessions share the intra-op thread pool of the first one, "
+            f"so its size and CPU affinity apply to all of them. Set {PER_SESSION_POOL_VAR}=1 "
+            "at the startup to give each session its own"
+        )
+    import tensorflow as tf
+
+    graph = tf.Graph()
+    config = tf.compat.v1.ConfigProto()
+    config.gpu_options.allow_growth = True
+    config.intra_op_parallelism_threads = intra_op_threads
+    config.inter_op_parallelism_threads = inter_op_threads
+    config.use_per_session_threads = True
+    sess = tf.compat.v1.Session(graph=graph, config=config)
+    return graph, sess
+
+
+class HMRBackend(InferenceBackend):
+    """The base backend of the HMR model, which runs one of the :mod: `hmr_model` implementations.
+
+    The inputs are the preprocessed images and the outputs are those of :method: `hmr_model.HMR.predict_dict`.
+
+    Attributes
+    ----------
+    model_cfg : `module`
+        The configuration options for the HMR model.
+    graph : `tensorflow.Graph`
+        The computational graph to be used.
+    sess : `tensorflow.Session`
+        The session to be used.
+    model : `hmr_model.HMR`
+        The HMR model.
+    intra_op_threads : `int`
+        The number of threads that run each operation. If 0, tensorflow picks the number.
+    inter_op_threads : `int`
+        The number of operations that run in parallel. If 0, tensorflow picks the number.
+    batch_size : `int`
+        The number of images in each prediction, `model_cfg.batch_size` if `None`.
+        The exported models have a fixed batch size, which replaces it when they are loaded.
+    """
+
+    def __init__(
+        self, model_cfg, intra_op_threads=0, inter_op_threads=0, batch_size=None
+    ):
+        self.model_cfg = model_cfg
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.batch_size = batch_size or model_cfg.batch_size
+
+    def load(self):
+        self.graph, self.sess = _create_session(
+            self.intra_op_threads, self.inter_op_threads
+        )
+        with self.graph.as_default():
+            self.model = self._load_model()
+        self.batch_size = self.model.batch_size
+
+    @abstractmethod
+    def _load_model(self):
+        """Returns the HMR model, loaded in :attr: `sess`."""
+        pass
+
+    def predict(self, inputs, outputs=None):
+        return self.model.predict_dict(inputs, outputs)
+
+    def lock_shape(self, shape):
+        """Lock the shape of the predicted SMPL mesh, or unlock it if `None`.
+
+        Parameters
+        ----------
+        shape : `numpy.ndarray`, (10)
+            The SMPL shape coefficients of the user.
+        """
+        self.model.lock_shape(shape)
+
+    def set_ief(self, stages, threshold):
+        """Set the iterative error feedback of the next predictions.
+
+        The frozen graph runs all the stages, so only the threshold applies to it,
+        and the TFLite model runs all the stages without the early exit, so neither applies to it.
+
+        Parameters
+        ----------
+        stages : `int`
+            The number of stages to run, at most `model_cfg.num_stage`.
+        threshold : `float`
+            The theta update norm below which the stages stop early. 0 disables the early exit.
+        """
+        self.model.ief_stages = stages
+        self.model.ief_threshold = threshold
+
+    def close(self):
+        self.sess.close()
+
+
+class HMRSessionBackend(HMRBackend):
+    """Runs the HMR model restored from the checkpoint in a tensorflow session."""
+
+    name = "tf_session"
+
+    def _load_model(self):
+        from .hmr_model import HMR
+
+        return HMR(self.model_cfg, sess=self.sess, batch_size=self.batch_size)
+
+
+class HMRFrozenGraphBackend(HMRBackend):
+    """Runs the frozen inference graph of the HMR model in a tensorflow session."""
+
+    name = "frozen_graph"
+
+    def _load_model(self):
+        from .hmr_model import FrozenHMR
+
+        return FrozenHMR(
+            self.model_cfg, self.model_cfg.frozen_graph_path, sess=self.sess
+        )
+
+
+class HMRTFLiteBackend(HMRBackend):
+    """Runs the TFLite model of the HMR model with the TFLite interpreter.
+
+    The interpreter runs with :attr: `intra_op_threads` threads, or `model_cfg.tflite_threads` when it is 0,
+    only when `tflite_runtime` is installed, since the interpreter of tensorflow 1.15 cannot set them.
+    """
+
+    name = "tflite"
+
+    def _load_model(self):
+        from .hmr_model import TFLiteHMR
+
+        return TFLiteHMR(
+            self.model_cfg,
+            self.model_cfg.tflite_path,
+            sess=self.sess,
+            num_threads=self.intra_op_threads or self.model_cfg.tflite_threads,
+        )
+
+
+class SMPLSessionBackend(InferenceBackend):
+    """Runs the SMPL model in a tensorflow session.
+
+    The inputs are the 82 thetas of each frame and the outputs are the `vertices`
+    and the 24 `keypoints` of the SMPL mesh. Any number of frames can be predicted at once.
+    The shaped template and the rest joints are cached per shape and fed
+    for the batches of a single shape, which skips the shape blend shapes and the joint regression.
+    The `keypoints` are the joints of the forward kinematics, so when only they are predicted,
+    the pose blend shapes and the skinning of the mesh are not run.
+
+    Attributes
+    ----------
+    smpl_model_path : `str`
+        The path where the SMPL model is saved.
+    joint_type : `str` {'cocoplus', 'lsp'}
+        The type of joints of the SMPL model.
+    batch_size : `int`
+        The number of frames in each prediction.
+    intra_op_threads : `int`
+        The number of threads that run each operation. If 0, tensorflow picks the number.
+    inter_op_threads : `int`
+        The number of operations that run in parallel. If 0, tensorflow picks the number.
+    smpl_options : `dict`
+        The keyword arguments of the SMPL model, its approximations.
+    """
+
+    name = "tf_session"
+    # The number of shapes whose shaped template and rest joints are cached
+    shape_cache_size = 8
+
+    def __init__(
+        self,
+        smpl_model_path,
+        joint_type,
+        batch_size=1,
+        intra_op_threads=0,
+        inter_op_threads=0,
+        smpl_options=None,
+    ):
+        self.smpl_model_path = smpl_model_path
+        self.joint_type = joint_type
+        self.batch_size = batch_size
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.smpl_options = smpl_options or {}
+
+    def load(self):
+        import tensorflow as tf
+        from .tf_smpl.batch_smpl import SMPL
+
+        self.graph, self.sess = _create_session(
+            self.intra_op_threads, self.inter_op_threads
+        )
+        with self.graph.as_default():
+            self.smpl = SMPL(self.smpl_model_path, self.joint_type, **self.smpl_options)
+            # Thetas are 72 pose variables holding the rotation of 24 joints in axis angle format
+            # and 10 shape coefficients of SMPL
+            self.thetas = tf.compat.v1.placeholder(
+                tf.float32, shape=(self.batch_size, 82)
+            )
+
+            pose, shape = self.thetas[:, :72], self.thetas[:, 72:]
+            verts, _, joints = self.smpl(shape, pose, get_skin=True)
+            self.outputs = {"vertices": verts, "keypoints": joints}
+            self.shaped = (self.smpl.v_shaped, self.smpl.J_rest)
+            self._shape_cache = OrderedDict()
+
+            self.smpl.initialize(self.sess)
+
+    def predict(self, inputs, outputs=None):
+        """Run the model on any number of frames.
+
+        The graph has a static batch size, so the frames are split in batches
+        and the last batch is padded with copies of its last frame.
+        """
+        fetch_dict = self.outputs
+        if outputs is not None:
+            fetch_dict = {name: self.outputs[name] for name in outputs}
+        if len(inputs) == self.batch_size:
+            return self._run(fetch_dict, inputs)
+
+        results = []
+        for start in range(0, len(inputs), self.batch_size):
+            batch = inputs[start : start + self.batch_size]
+            npad = self.batch_size - len(batch)
+            if npad > 0:
+                batch = np.concatenate([batch, np.repeat(batch[-1:], npad, axis=0)])
+            results.append(self._run(fetch_dict, batch))
+        return {
+            name: np.concatenate([result[name] for result in results])[: len(inputs)]
+            for name in fetch_dict
+        }
+
+    def _run(self, fetch_dict, batch):
+        """Run a batch, feeding the cached shaped template and rest joints when it has a single shape."""
+        feed_dict = {self.thetas: batch}
+        shape = batch[0, 72:]
+        if not np.all(batch[:, 72:] == shape):
+            return self.sess.run(fetch_dict, feed_dict)
+
+        key = np.asarray(shape, dtype=np.float32).tobytes()
+        shaped = self._shape_cache.get(key)
+        if shaped is None:
+            results, shaped = self.sess.run((fetch_dict, self.shaped), feed_dict)
+            self._shape_cache[key] = shaped
+            if len(self._shape_cache) > self.shape_cache_size:
+                self._shape_cache.popitem(last=False)
+            return results
+
+        self._shape_cache.move_to_end(key)
+        feed_dict.update(zip(self.shaped, shaped))
+        return self.sess.run(fetch_dict, feed_dict)
+
+    def close(self):
+        self.sess.close()
+
+
+class SMPLNumpyBackend(SMPLSessionBackend):
+    """Runs the SMPL model with NumPy, without tensorflow.
+
+    The inputs and the outputs are those of the :class: `SMPLSessionBackend`.
+    The thread pools are not configurable, NumPy uses those of its BLAS library.
+    """
+
+    name = "numpy"
+
+    def load(self):
+        from .tf_smpl.np_smpl import NumpySMPL
+
+        self.smpl = NumpySMPL(
+            self.smpl_model_path, self.joint_type, **self.smpl_options
+        )
+
+    def predict(self, inputs, outputs=None):
+        pose, shape = inputs[:, :72], inputs[:, 72:]
+        if outputs is not None and "vertices" not in outputs:
+            return {"keypoints": self.smpl.posed_joints(shape, pose)}
+        verts, _, joints = self.smpl(shape, pose, get_skin=True)
+        results = {"vertices": verts, "keypoints": joints}
+        if outputs is not None:
+            results = {name: results[name] for name in outputs}
+        return results
+
+    def close(self):
+        pass
+
+
+HMR_BACKENDS = {
+    backend.name: backend
+    for backend in (HMRSessionBackend, HMRFrozenGraphBackend, HMRTFLiteBackend)
+}
+SMPL_BACKENDS = {
+    backend.name: backend for backend in (SMPLSessionBackend, SMPLNumpyBackend)
+}
+
+
+def create_hmr_backend(
+    name, model_cfg, intra_op_threads=0, inter_op_threads=0, batch_size=None
+):
+    """Create an HMR backend.
+
+    Parameters
+    ----------
+    name : `str`
+        The name of the backend, or 'auto' for the fastest exported model:
+        the TFLite model, then the frozen graph, then the checkpoint.
+    model_cfg : `module`
+        The configuration options for the HMR model.
+    intra_op_threads : `int`
+        The number of threads that run each operation. If 0, the backend picks the number.
+    inter_op_threads : `int`
+        The number of operations that run in parallel. If 0, the backend picks the number.
+    batch_size : `int`, optional
+        The number of images in each prediction of the checkpoint, `model_cfg.batch_size` if `None`.
+
+    Raises
+    ------
+    ValueError
+        If there is no backend with that name.
+    """
+    if name == "auto":
+        if os.path.exists(model_cfg.tflite_path):
+            name = HMRTFLiteBackend.name
+        elif os.path.exists(model_cfg.frozen_graph_path):
+            name = HMRFrozenGraphBackend.name
+        else:
+            name = HMRSessionBackend.name
+
+    if name not in HMR_BACKENDS:
+        raise ValueError(f"Unknown HMR backend `{name}`")
+    return HMR_BACKENDS[name](model_cfg, intra_op_threads, inter_op_threads, batch_size)
+
+
+def create_smpl_backend(
+    name,
+    smpl_model_path,
+    joint_type,
+    batch_size=1,
+    intra_op_threads=0,
+    inter_op_threads=0,
+    smpl_options=None,
+):
+    """Create a SMPL backend.
+
+    Parameters
+    ----------
+    name : `str`
+        The name of the backend.
+    smpl_model_path : `str`
+        The path where the SMPL model is saved.
+    joint_type : `str` {'cocoplus', 'lsp'}
+        The type of joints of the SMPL model.
+    batch_size : `int`
+        The number of frames in each prediction.
+    intra_op_threads : `int`
+        The number of threads that run each operation. If 0, the backend picks the number.
+    inter_op_threads : `int`
+        The number of operations that run in parallel. If 0, the backend picks the number.
+    smpl_options : `dict`
+        The keyword arguments of the SMPL model, its approximations.
+
+    Raises
+    ------
+    ValueError
+        If there is no backend with that name.
+    """
+    if name not in SMPL_BACKENDS:
+        raise ValueError(f"Unknown SMPL backend `{name}`")
+    return SMPL_BACKENDS[name](
+        smpl_model_path,
+        joint_type,
+        batch_size,
+        intra_op_threads,
+        inter_op_threads,
+        smpl_options,
+    )
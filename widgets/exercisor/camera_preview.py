@@ -0,0 +1,28 @@
+from kivy.clock import mainthread
+from kivy.graphics.texture import Texture
+from kivy.uix.image import Image
+
+
+class CameraPreview(Image):
+    """Displays the frames of the camera inside the Exercisor screen.
+
+    The frames are uploaded to a texture with a buffer blit, without any window of opencv.
+    """
+
+    @mainthread
+    def update_frame(self, frame):
+        """Display a new camera frame.
+
+        Parameters
+        ----------
+        frame : `numpy.ndarray`, (H x W x 3)
+            The BGR image of the camera frame.
+        """
+        height, width = frame.shape[:2]
+        if self.texture is None or self.texture.size != (width, height):
+            self.texture = Texture.create(size=(width, height), colorfmt="bgr")
+            # Opencv images start from the top row
+            self.texture.flip_vertical()
+
+        self.texture.blit_buffer(frame.ravel(), colorfmt="bgr", bufferfmt="ubyte")
+        self.canvas.ask_update()
@@ -0,0 +1,135 @@
+from collections import deque
+import errno
+import os
+import threading
+import time
+
+import cv2
+
+from .utils.log import logger
+
+
+class CaptureThread(threading.Thread):
+    """Continuously grabs the frames of a capture source on a separate thread.
+
+    The frames are timestamped and stored in a small ring buffer, so that the consumer
+    always gets the freshest frame without waiting for the camera to decode it.
+    For the camera, when the buffer is full the oldest frame is dropped. For video files,
+    the producer waits for the consumer instead, so that every frame of the video is used.
+
+    Attributes
+    ----------
+    source : `str`
+        The capture source. Can be either 'cam' or a video file path.
+    buffer_size : `int`
+        The maximum number of frames held in the ring buffer.
+    drop_oldest : `bool`
+        Whether to drop the oldest frame when the buffer is full or to wait for the consumer.
+    finished : `bool`
+        `True` if the capture source has no more frames.
+    """
+
+    cam_index = 2
+
+    def __init__(self, source, buffer_size=2, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = "CaptureThread"
+        self.daemon = True
+
+        self.source = source
+        self.buffer_size = buffer_size
+        self.drop_oldest = source == "cam"
+        self.finished = False
+
+        if self.source == "cam":
+            self._capture = cv2.VideoCapture(self.cam_index)
+            # Keep the driver's queue short, the ring buffer holds the recent frames
+            self._capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        elif os.path.exists(self.source):
+            self._capture = cv2.VideoCapture(self.source)
+        else:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+
+        self._frames = deque(maxlen=self.buffer_size)
+        self._cond = threading.Condition()
+        self._resumed = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.start()
+
+    def pause(self):
+        """Pauses the grabbing of frames."""
+        self._resumed.clear()
+
+    def resume(self):
+        """Resumes the grabbing of frames."""
+        self._resumed.set()
+
+    def get_frame_count(self):
+        """Returns the total number of frames of a video file, or 0 if it is not known."""
+        return max(int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+
+    def release(self):
+        """Stops the grabbing of frames and releases the capture source."""
+        self._running.clear()
+        self._resumed.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def run(self):
+        """Grab the frames of the source and push them to the ring buffer."""
+        while self._running.is_set():
+            self._resumed.wait()
+            if not self._running.is_set():
+                break
+
+            ret, frame = self._capture.read()
+            timestamp = time.time()
+
+            with self._cond:
+                if not ret:
+                    self.finished = True
+                    self._cond.notify_all()
+                    break
+
+                while (
+                    not self.drop_oldest
+                    and len(self._frames) == self.buffer_size
+                    and self._running.is_set()
+                ):
+                    self._cond.wait()
+                # When full, the deque discards the oldest frame
+                self._frames.append((frame, timestamp))
+                self._cond.notify_all()
+
+        self._capture.release()
+        logger.debug(f"Released the capture source `{self.source}`")
+
+    def read(self, timeout=1.0):
+        """Get the freshest frame of the ring buffer.
+
+        If the buffer is empty, wait for the next frame. For the camera, the wait lasts
+        at most :param: `timeout` seconds, while for video files it lasts until the next frame
+        is decoded or the video has finished.
+
+        Returns
+        -------
+        `tuple` [`bool`, `numpy.ndarray`, `float`]
+            The retrieval status, the frame image and the time the frame was grabbed.
+            The retrieval status is `False` if no frame was available.
+        """
+        with self._cond:
+            while not self._frames and not self.finished and self._running.is_set():
+                if not self._cond.wait(timeout) and self.drop_oldest:
+                    break
+            if not self._frames:
+                return False, None, None
+
+            if self.drop_oldest:
+                # Older frames are stale, so only the latest one is used
+                frame, timestamp = self._frames.pop()
+                self._frames.clear()
+            else:
+                frame, timestamp = self._frames.popleft()
+            self._cond.notify_all()
+            return True, frame, timestamp
@@ -111,7 +111,7 @@ class EditorControls(AbstractControls):
             self.ids.prog_slider.max = len(self.exercises[exercise_name]) - 1
             self.actions["predict"].stop()
             self.actions["playback"].initialize(
-                self.smpl_mode, self.exercises[exercise_name]
+                self.smpl_mode, self.exercises[exercise_name], exercise_name
             )
 
     def update(self, exercise_controller):
@@ -3,6 +3,7 @@ import os
 
 import numpy as np
 
+from .geometry_cache import GeometryCache
 from .utils.observable import Observable
 from .utils.log import logger
 from .utils.process_thetas import (
@@ -58,7 +59,11 @@ class ExerciseController(Observable):
         if not os.path.isdir(folder):
             logger.warning(f"The path `{folder}` does not exist or it is not a folder.")
             return
-        files = os.listdir(folder)
+        files = [
+            file
+            for file in os.listdir(folder)
+            if file.endswith(".npy") and not GeometryCache.is_cache_file(file)
+        ]
         exercises = {
             os.path.splitext(file)[0]: np.load(os.path.join(folder, file))
             for file in files
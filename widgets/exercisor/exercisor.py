@@ -1,8 +1,10 @@
 import os
+import threading
 from functools import partial
 import numpy as np
 
 from kivy.app import App
+from kivy.clock import mainthread
 from kivy.core.window import Window
 from kivy.uix.widget import Widget
 from kivy.uix.screenmanager import Screen
@@ -11,16 +13,20 @@ from kivy.properties import ConfigParserProperty
 from kivy.config import ConfigParser  # ,Config
 
 from .renderer import Renderer
+from .camera_preview import CameraPreview
 from .hmr_thread import HMRThread
 from .smpl_thread import SMPLThread
+from .ml_thread import parse_cpu_list
 import widgets.exercisor.model_cfg as model_cfg
 
 from .editor.editor_controls import EditorControls
 from .play.play_controls import PlayControls
+from .play.mesh_utils import load_decimated_faces
 
 from .actions import PlaybackAction, PredictAction, PlayAction
 
 from .exercise_controller import ExerciseController
+from .geometry_cache import GeometryCache
 
 from .utils.wit_wrapper import WitWrapper
 from .utils.log import logger
@@ -50,6 +56,43 @@ class ExercisorScreen(Screen):
     obj_mesh_path = ConfigParserProperty(
         "./widgets/exercisor/play/monkey.obj", "Exercisor", "obj_mesh_path", "Exercisor"
     )
+    camera_preview = ConfigParserProperty(
+        0, "Exercisor", "camera_preview", "Exercisor", val_type=int
+    )
+    hmr_backend = ConfigParserProperty("auto", "Exercisor", "hmr_backend", "Exercisor")
+    # The iterative error feedback stages of HMR and the early exit threshold, the 0 stages mean all of them
+    hmr_ief_stages = ConfigParserProperty(
+        0, "Exercisor", "hmr_ief_stages", "Exercisor", val_type=int
+    )
+    hmr_ief_threshold = ConfigParserProperty(
+        0.0, "Exercisor", "hmr_ief_threshold", "Exercisor", val_type=float
+    )
+    smpl_backend = ConfigParserProperty(
+        "tf_session", "Exercisor", "smpl_backend", "Exercisor"
+    )
+    # The level of detail of the rendered SMPL meshes, 0 for the full mesh
+    mesh_lod = ConfigParserProperty(
+        0, "Exercisor", "mesh_lod", "Exercisor", val_type=int
+    )
+    # The thread pools and the CPU cores of each model thread. The 0 threads and no cores mean the defaults
+    hmr_intra_op_threads = ConfigParserProperty(
+        0, "Exercisor", "hmr_intra_op_threads", "Exercisor", val_type=int
+    )
+    hmr_inter_op_threads = ConfigParserProperty(
+        0, "Exercisor", "hmr_inter_op_threads", "Exercisor", val_type=int
+    )
+    hmr_cpu_affinity = ConfigParserProperty(
+        "", "Exercisor", "hmr_cpu_affinity", "Exercisor"
+    )
+    smpl_intra_op_threads = ConfigParserProperty(
+        0, "Exercisor", "smpl_intra_op_threads", "Exercisor", val_type=int
+    )
+    smpl_inter_op_threads = ConfigParserProperty(
+        0, "Exercisor", "smpl_inter_op_threads", "Exercisor", val_type=int
+    )
+    smpl_cpu_affinity = ConfigParserProperty(
+        "", "Exercisor", "smpl_cpu_affinity", "Exercisor"
+    )
 
     def __init__(self, **kwargs):
         # Load the kv files
@@ -64,9 +107,37 @@ class ExercisorScreen(Screen):
 
         # Create the SMPL and HMR threads
         self.mlthreads = {}
-        self.mlthreads["hmr"] = HMRThread(model_cfg, self.save_exercise)
+        self.mlthreads["hmr"] = HMRThread(
+            model_cfg,
+            self.save_exercise,
+            backend=self.hmr_backend,
+            ief_stages=self.hmr_ief_stages,
+            ief_threshold=self.hmr_ief_threshold,
+            **self._mlthread_config("hmr"),
+        )
         self.mlthreads["smpl"] = SMPLThread(
-            model_cfg.smpl_model_path, model_cfg.joint_type
+            model_cfg.smpl_model_path,
+            model_cfg.joint_type,
+            geometry_cache=GeometryCache(
+                self.exercises_path, model_cfg.smpl_model_path, model_cfg.smpl_options
+            ),
+            smpl_options=model_cfg.smpl_options,
+            backend=self.smpl_backend,
+            **self._mlthread_config("smpl"),
+        )
+        for mlthread in self.mlthreads.values():
+            mlthread.attach(self)
+        for key in self.mlthreads:
+            configure = partial(self._configure_mlthread, key)
+            self.bind(
+                **{
+                    f"{key}_intra_op_threads": configure,
+                    f"{key}_inter_op_threads": configure,
+                    f"{key}_cpu_affinity": configure,
+                }
+            )
+        self.bind(
+            hmr_ief_stages=self._configure_ief, hmr_ief_threshold=self._configure_ief
         )
 
         # Create the renderer widgets for the SMPL and HMR treads and for the error vectors
@@ -78,6 +149,7 @@ class ExercisorScreen(Screen):
         renderers = [Renderer(**kwargs), Renderer(**kwargs), Renderer(**kwargs)]
         for rend in renderers:
             self.ids.renderer_layout.add_widget(rend)
+        self._load_mesh_lod(self.mesh_lod)
 
         # Create the color adjustment dialog and bind the color change function
         self.color_adjust_dialog = ColorAdjustDialog()
@@ -101,7 +173,121 @@ class ExercisorScreen(Screen):
 
         self.exercise_controller = ExerciseController(self.exercises_path)
 
+        self.camera_preview_widget = CameraPreview()
+        self.on_camera_preview(self, self.camera_preview)
+
         self.change_control("normal")  # Displays the control buttons
+        # The models may have advanced their loading before they were observed
+        self.update(self.mlthreads["hmr"])
+
+    @mainthread
+    def update(self, mlthread, *args):
+        """Display the loading progress of the models, when the loading of a model advances.
+
+        Parameters
+        ----------
+        mlthread : `ml_thread.MLThread`
+            The model thread whose loading advanced.
+        """
+        mlthreads = self.mlthreads.values()
+        failed = [
+            thread.model_name for thread in mlthreads if thread.status == "failed"
+        ]
+        if failed:
+            self.ids.info_label.text = f"Failed to load the {', '.join(failed)} model"
+        elif all(thread.is_ready() for thread in mlthreads):
+            self.ids.info_label.text = "The models are ready"
+        else:
+            progress = sum(thread.progress for thread in mlthreads) / len(mlthreads)
+            self.ids.info_label.text = f"Loading the models... {progress:.0%}"
+
+    def on_camera_preview(self, instance, value):
+        """Display the camera preview or remove it, disabling the HMR thread's preview."""
+        if not hasattr(self, "camera_preview_widget"):
+            return
+
+        self.ids.renderer_layout.remove_widget(self.camera_preview_widget)
+        if value:
+            self.ids.renderer_layout.add_widget(self.camera_preview_widget)
+            self.mlthreads["hmr"].preview_fn = self.camera_preview_widget.update_frame
+        else:
+            self.mlthreads["hmr"].preview_fn = None
+
+    def on_hmr_backend(self, instance, value):
+        """Switch the inference backend of the HMR thread."""
+        if hasattr(self, "mlthreads"):
+            self.mlthreads["hmr"].set_backend(value)
+
+    def on_smpl_backend(self, instance, value):
+        """Switch the inference backend of the SMPL thread."""
+        if hasattr(self, "mlthreads"):
+            self.mlthreads["smpl"].set_backend(value)
+
+    def on_mesh_lod(self, instance, value):
+        """Set the level of detail of the rendered SMPL meshes, from their next scene."""
+        if hasattr(self, "mlthreads"):
+            self._load_mesh_lod(value)
+
+    def _load_mesh_lod(self, level):
+        """Load the decimated SMPL mesh of a level of detail in the background, like the models.
+
+        Parameters
+        ----------
+        level : `int`
+            The number of edges around each kept vertex whose vertices are merged to it.
+            0 renders the full mesh.
+        """
+        if level <= 0:
+            self._set_mesh_lod(level, None)
+            return
+
+        def load():
+            try:
+                lod = load_decimated_faces(model_cfg.smpl_faces_path, level)
+            except (OSError, ValueError) as err:
+                logger.error(f"Failed to load the level of detail {level}: {err}")
+                lod = None
+            self._set_mesh_lod(level, lod)
+
+        threading.Thread(target=load, daemon=True).start()
+
+    @mainthread
+    def _set_mesh_lod(self, level, lod):
+        """Pass the decimated SMPL mesh to the renderers, unless the level of detail changed meanwhile."""
+        if level != self.mesh_lod:
+            return
+        for renderer in self.ids.renderer_layout.walk(restrict=True):
+            if type(renderer) == Renderer:
+                renderer.set_lod(lod)
+
+    def _mlthread_config(self, key):
+        """Returns the thread pools and the CPU affinity settings of a model thread.
+
+        Parameters
+        ----------
+        key : `str` { 'hmr', 'smpl' }
+            The model thread.
+        """
+        cpu_affinity = getattr(self, f"{key}_cpu_affinity")
+        try:
+            cpus = parse_cpu_list(cpu_affinity)
+        except ValueError:
+            logger.error(f"Invalid CPU list `{cpu_affinity}`, the affinity is not set")
+            cpus = None
+
+        return {
+            "intra_op_threads": getattr(self, f"{key}_intra_op_threads"),
+            "inter_op_threads": getattr(self, f"{key}_inter_op_threads"),
+            "cpu_affinity": cpus,
+        }
+
+    def _configure_ief(self, *args):
+        """Apply the changed iterative error feedback settings to the HMR thread."""
+        self.mlthreads["hmr"].set_ief(self.hmr_ief_stages, self.hmr_ief_threshold)
+
+    def _configure_mlthread(self, key, *args):
+        """Apply the changed thread pools and CPU affinity settings to a model thread."""
+        self.mlthreads[key].configure(**self._mlthread_config(key))
 
     def update_config(self):
         # Documentation for settings
@@ -153,6 +339,7 @@ class ExercisorScreen(Screen):
                 elif color_type == "diffuse":
                     renderer.canvas["diffuse_light"] = new_color
 
+    @mainthread
     def save_exercise(self, exercise_name, thetas):
         """Save the thetas of the exercise and update the list of available exercises
 
@@ -0,0 +1,327 @@
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+from . import model_cfg
+from .capture_thread import CaptureThread
+from .hmr_model import HMR, FrozenHMR, TFLiteHMR
+from .utils.preprocess import ImagePreprocessor
+from .utils.log import logger
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+def freeze_hmr(config, output_path):
+    """Export the HMR model as a frozen and optimised inference graph.
+
+    The graph keeps only the nodes needed for the fetched outputs. The variables are converted to constants,
+    the batch norms are folded, the constant subgraphs are precomputed and the training nodes are stripped.
+    The `ief_threshold` input of the early exit becomes a placeholder that must always be fed.
+
+    Parameters
+    ----------
+    config : `module`
+        The configuration options for the HMR model.
+    output_path : `str`
+        The path of the exported graph.
+    """
+    output_names = list(FrozenHMR.output_names)
+    graph = tf.Graph()
+    with graph.as_default():
+        sess = tf.compat.v1.Session(graph=graph)
+        model = HMR(config, sess=sess)
+        # Name the outputs, so that they can be found in the frozen graph
+        for name in output_names:
+            tf.identity(model.outputs[name], name=name)
+
+        graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(
+            sess, graph.as_graph_def(), output_names
+        )
+        sess.close()
+
+    graph_def = tf.compat.v1.graph_util.remove_training_nodes(
+        graph_def, protected_nodes=output_names
+    )
+    input_names = ["images", "ief_threshold"]
+    transforms = [
+        "strip_unused_nodes",
+        "remove_nodes(op=Identity, op=CheckNumerics)",
+        "fold_constants(ignore_errors=true)",
+        "fold_batch_norms",
+        "fold_old_batch_norms",
+        "strip_unused_nodes",
+        "sort_by_execution_order",
+    ]
+    graph_def = TransformGraph(graph_def, input_names, output_names, transforms)
+
+    with tf.io.gfile.GFile(output_path, "wb") as f:
+        f.write(graph_def.SerializeToString())
+    logger.info(
+        f"Saved the frozen graph ({len(graph_def.node)} nodes) to {output_path}"
+    )
+
+
+def sample_images(video_path, img_size, num_samples):
+    """Yield preprocessed frames spread evenly over a video.
+
+    Parameters
+    ----------
+    video_path : `str`
+        The path of the video file.
+    img_size : `int`
+        The size of the preprocessed images.
+    num_samples : `int`
+        The maximum number of frames to yield.
+
+    Yields
+    ------
+    `numpy.ndarray`, (1 x img_size x img_size x 3)
+        The preprocessed frame.
+    """
+    capture = CaptureThread(video_path)
+    total_frames = capture.get_frame_count()
+    step = max(total_frames // num_samples, 1)
+    preprocess = ImagePreprocessor(img_size)
+    capture.resume()
+
+    nframes, nsamples = 0, 0
+    try:
+        while nsamples < num_samples:
+            ret, frame, _ = capture.read()
+            if not ret:
+                break
+            if nframes % step == 0:
+                # The preprocessor reuses its buffer, so the image is copied
+                yield preprocess(frame)[0].copy()
+                nsamples += 1
+            nframes += 1
+    finally:
+        capture.release()
+
+
+def convert_tflite(
+    config, output_path, quantization="float16", video_path=None, num_samples=100
+):
+    """Export the encoder and the regressor of HMR as a TFLite model that predicts the theta.
+
+    The stages are exported without the early exit, since TFLite does not convert its control flow.
+    SMPL is left out, so :class: `hmr_model.TFLiteHMR` computes the mesh and the joints in tensorflow.
+
+    Parameters
+    ----------
+    config : `module`
+        The configuration options for the HMR model.
+    output_path : `str`
+        The path of the exported model.
+    quantization : `str` { 'none', 'float16', 'int8' }
+        The post-training quantisation of the model.
+        The int8 quantisation calibrates the activations on the frames of :param: `video_path`.
+    video_path : `str`, optional
+        The sample video of the int8 calibration.
+    num_samples : `int`
+        The number of calibration frames.
+
+    Raises
+    ------
+    ValueError
+        If the quantisation is unknown, or it is int8 and no sample video was given.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantisation `{quantization}`")
+    if quantization == "int8" and video_path is None:
+        raise ValueError("The int8 quantisation needs a sample video to calibrate")
+
+    graph = tf.Graph()
+    with graph.as_default():
+        sess = tf.compat.v1.Session(graph=graph)
+        model = HMR(config, sess=sess, batch_size=1, early_exit=False)
+        converter = tf.compat.v1.lite.TFLiteConverter.from_session(
+            sess, [model.images_pl], [model.outputs["theta"]]
+        )
+        if quantization == "float16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == "int8":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = tf.lite.RepresentativeDataset(
+                lambda: (
+                    [images]
+                    for images in sample_images(
+                        video_path, config.img_size, num_samples
+                    )
+                )
+            )
+        tflite_model = converter.convert()
+        sess.close()
+
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    logger.info(
+        f"Saved the {quantization} TFLite model ({len(tflite_model) / 2**20:.1f} MB) "
+        f"to {output_path}"
+    )
+
+
+def evaluate_tflite(config, model_path, video_path, num_frames=200):
+    """Compare the predictions and the speed of a TFLite model with the float HMR model on a sample video.
+
+    Both models run all the stages. The 3D joints of both thetas are computed with the same SMPL,
+    so the joint error reflects only the error of the thetas.
+
+    Parameters
+    ----------
+    config : `module`
+        The configuration options for the HMR model.
+    model_path : `str`
+        The path of the TFLite model.
+    video_path : `str`
+        The path of the sample video.
+    num_frames : `int`
+        The number of frames of the video to compare.
+
+    Returns
+    -------
+    `dict`
+        The mean absolute errors of the pose, shape and camera parameters,
+        the mean and max joint errors in mm and the mean prediction times in seconds.
+    """
+    reference_graph = tf.Graph()
+    with reference_graph.as_default():
+        reference_sess = tf.compat.v1.Session(graph=reference_graph)
+        reference = HMR(config, sess=reference_sess, batch_size=1)
+        reference.ief_threshold = 0.0
+
+    tflite_graph = tf.Graph()
+    with tflite_graph.as_default():
+        tflite_sess = tf.compat.v1.Session(graph=tflite_graph)
+        tflite = TFLiteHMR(
+            config, model_path, sess=tflite_sess, num_threads=config.tflite_threads
+        )
+
+    errors = {"pose": [], "shape": [], "cam": [], "joints": []}
+    times = {"reference": [], "tflite": []}
+    for images in sample_images(video_path, config.img_size, num_frames):
+        start = time.perf_counter()
+        theta = reference.predict_dict(images, ("theta",))["theta"]
+        times["reference"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tflite_theta = tflite.predict_theta(images)
+        times["tflite"].append(time.perf_counter() - start)
+
+        diff = np.abs(theta - tflite_theta)[0]
+        errors["cam"].append(diff[:3].mean())
+        errors["pose"].append(diff[3:75].mean())
+        errors["shape"].append(diff[75:].mean())
+
+        joints3d = [
+            tflite.sess.run(tflite.outputs["joints3d"], {tflite.theta_pl: t})[0]
+            for t in (theta, tflite_theta)
+        ]
+        errors["joints"].append(np.linalg.norm(joints3d[0] - joints3d[1], axis=1))
+
+    reference_sess.close()
+    tflite_sess.close()
+    if not errors["joints"]:
+        raise ValueError(f"No frames were read from `{video_path}`")
+
+    joint_errors = np.array(errors["joints"]) * 1000
+    report = {
+        "frames": len(joint_errors),
+        "pose_error": float(np.mean(errors["pose"])),
+        "shape_error": float(np.mean(errors["shape"])),
+        "cam_error": float(np.mean(errors["cam"])),
+        "joints_error": float(joint_errors.mean()),
+        "joints_error_max": float(joint_errors.max()),
+        # The first prediction includes the allocations, so it is left out
+        "reference_time": float(np.mean(times["reference"][1:] or times["reference"])),
+        "tflite_time": float(np.mean(times["tflite"][1:] or times["tflite"])),
+    }
+    logger.info(
+        f"Compared {report['frames']} frames of `{video_path}`\n"
+        f"  pose error: {report['pose_error']:.4f} rad, "
+        f"shape error: {report['shape_error']:.4f}, "
+        f"camera error: {report['cam_error']:.4f}\n"
+        f"  joint error: {report['joints_error']:.1f} mm mean, "
+        f"{report['joints_error_max']:.1f} mm max\n"
+        f"  float model: {1 / report['reference_time']:.1f} fps, "
+        f"TFLite: {1 / report['tflite_time']:.1f} fps "
+        f"({report['reference_time'] / report['tflite_time']:.2f}x)"
+    )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the HMR model for faster inference and evaluate the exports."
+    )
+    subparsers = parser.add_subparsers(dest="format", required=True)
+
+    frozen = subparsers.add_parser("frozen", help="export a frozen inference graph")
+    frozen.add_argument(
+        "-o",
+        "--output",
+        default=model_cfg.frozen_graph_path,
+        help="the path of the exported graph",
+    )
+
+    tflite = subparsers.add_parser(
+        "tflite", help="export a TFLite model of the encoder and the regressor"
+    )
+    tflite.add_argument(
+        "-o",
+        "--output",
+        default=model_cfg.tflite_path,
+        help="the path of the exported model",
+    )
+    tflite.add_argument(
+        "-q",
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default="float16",
+        help="the post-training quantisation (default: float16)",
+    )
+    tflite.add_argument(
+        "--video", help="the sample video to calibrate the int8 quantisation"
+    )
+    tflite.add_argument(
+        "--samples",
+        type=int,
+        default=100,
+        help="the number of calibration frames",
+    )
+
+    evaluate = subparsers.add_parser(
+        "evaluate", help="compare a TFLite model with the float model on a video"
+    )
+    evaluate.add_argument("video", help="the sample video")
+    evaluate.add_argument(
+        "-m",
+        "--model",
+        default=model_cfg.tflite_path,
+        help="the path of the TFLite model",
+    )
+    evaluate.add_argument(
+        "-n",
+        "--frames",
+        type=int,
+        default=200,
+        help="the number of frames to compare",
+    )
+
+    args = parser.parse_args(argv)
+    if args.format == "frozen":
+        freeze_hmr(model_cfg, args.output)
+    elif args.format == "tflite":
+        convert_tflite(
+            model_cfg, args.output, args.quantization, args.video, args.samples
+        )
+    elif args.format == "evaluate":
+        evaluate_tflite(model_cfg, args.model, args.video, args.frames)
+
+
+if __name__ == "__main__":
+    main()
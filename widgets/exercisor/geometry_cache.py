@@ -0,0 +1,195 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from .utils.log import logger
+
+
+class GeometryCache(object):
+    """Stores the precomputed SMPL geometry of the exercises next to their thetas.
+
+    The vertices and the keypoints of an exercise are saved as float32 `.npy` files,
+    `<name>.<key>.verts.npy` and `<name>.<key>.kpnts.npy`, and they are opened memory-mapped,
+    so that the geometry of the exercises costs page cache instead of heap.
+    The key is a hash of the thetas, of the SMPL model file, its size and modification time, and of its options.
+    So when the thetas of an exercise change, for example when a rule is applied to them,
+    or the model changes, the previous entry is no longer found and it is replaced.
+
+    Attributes
+    ----------
+    folder : `str`
+        The folder of the exercises.
+    smpl_model_path : `str`
+        The path of the SMPL model that computes the geometry.
+    smpl_options : `dict`
+        The keyword arguments of the SMPL model, its approximations.
+    """
+
+    suffixes = {"vertices": ".verts.npy", "keypoints": ".kpnts.npy"}
+
+    def __init__(self, folder, smpl_model_path, smpl_options=None):
+        self.folder = folder
+        self.smpl_model_path = smpl_model_path
+        self.smpl_options = smpl_options or {}
+
+    @classmethod
+    def is_cache_file(cls, filename):
+        """Returns `True` if the file is a geometry file of the cache, `False` otherwise."""
+        return filename.endswith(tuple(cls.suffixes.values()))
+
+    def key(self, thetas):
+        """Returns the key of the geometry of the thetas."""
+        thetas = np.ascontiguousarray(thetas, dtype=np.float32)
+        digest = hashlib.sha1(os.path.basename(self.smpl_model_path).encode())
+        try:
+            # A different model saved under the same name invalidates the cached geometry
+            stat = os.stat(self.smpl_model_path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            pass
+        digest.update(repr(sorted(self.smpl_options.items())).encode())
+        digest.update(str(thetas.shape).encode())
+        digest.update(thetas.tobytes())
+        return digest.hexdigest()[:16]
+
+    def _path(self, name, key, output):
+        return os.path.join(self.folder, f"{name}.{key}{self.suffixes[output]}")
+
+    def load(self, name, thetas, outputs=("vertices", "keypoints")):
+        """Open the cached geometry of an exercise.
+
+        Parameters
+        ----------
+        name : `str`
+            The name of the exercise.
+        thetas : `numpy.ndarray`, (N x 82)
+            The thetas of the exercise, after the smoothing and the rules.
+        outputs : `iterable` [`str`]
+            The outputs to open, out of `vertices` and `keypoints`.
+
+        Returns
+        -------
+        `dict` [`str`, `numpy.ndarray`]
+            The memory-mapped outputs of the exercise, or `None` if any of them is not cached.
+        """
+        key = self.key(thetas)
+        paths = {output: self._path(name, key, output) for output in outputs}
+        if not all(os.path.isfile(path) for path in paths.values()):
+            return None
+
+        try:
+            geometry = {
+                output: np.load(path, mmap_mode="r") for output, path in paths.items()
+            }
+        except (OSError, ValueError) as err:
+            logger.warning(f"Failed to open the cached geometry of `{name}`: {err}")
+            return None
+        if any(len(values) != len(thetas) for values in geometry.values()):
+            return None
+        return geometry
+
+    def create(self, name, thetas, output, shape):
+        """Create a writable memory-mapped output of an exercise, to compute the geometry into.
+
+        The output is a temporary `.part` file, which :method: `save` moves in place,
+        so that the geometry is not held on the heap while it is computed, and no partial entries are left.
+
+        Parameters
+        ----------
+        name : `str`
+            The name of the exercise.
+        thetas : `numpy.ndarray`, (N x 82)
+            The thetas of the exercise, after the smoothing and the rules.
+        output : `str` { 'vertices', 'keypoints' }
+            The output to create.
+        shape : `tuple` [`int`]
+            The shape of the output, the frames first.
+
+        Returns
+        -------
+        `numpy.memmap`
+            The writable output, or `None` if it could not be created.
+        """
+        if not os.path.isdir(self.folder):
+            return None
+
+        tmp_path = self._path(name, self.key(thetas), output) + ".part"
+        try:
+            return np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.float32, shape=shape
+            )
+        except OSError as err:
+            logger.warning(f"Failed to cache the geometry of `{name}`: {err}")
+            return None
+
+    def save(self, name, thetas, geometry):
+        """Save the geometry of an exercise and remove its previous entries.
+
+        The outputs created with :method: `create` are moved in place, and the rest are written.
+
+        Parameters
+        ----------
+        name : `str`
+            The name of the exercise.
+        thetas : `numpy.ndarray`, (N x 82)
+            The thetas of the exercise, after the smoothing and the rules.
+        geometry : `dict` [`str`, `numpy.ndarray`]
+            The `vertices` and/or the `keypoints` of each frame of the exercise.
+
+        Returns
+        -------
+        `dict` [`str`, `numpy.ndarray`]
+            The memory-mapped saved geometry, or the given geometry if it could not be saved.
+        """
+        if not os.path.isdir(self.folder):
+            return geometry
+
+        key = self.key(thetas)
+        try:
+            for output, values in geometry.items():
+                path = self._path(name, key, output)
+                # Write to a temporary file first, so that no partial entries are left
+                tmp_path = f"{path}.part"
+                if getattr(values, "filename", None) != os.path.abspath(tmp_path):
+                    array = np.lib.format.open_memmap(
+                        tmp_path, mode="w+", dtype=np.float32, shape=values.shape
+                    )
+                    array[:] = values
+                    values = array
+                values.flush()
+                del values
+                os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning(f"Failed to cache the geometry of `{name}`: {err}")
+            return geometry
+
+        self._remove_stale(name, key)
+        return self.load(name, thetas, geometry) or geometry
+
+    def discard(self, name, thetas, geometry):
+        """Remove the outputs of an exercise created with :method: `create` that will not be saved."""
+        key = self.key(thetas)
+        for output in geometry:
+            tmp_path = self._path(name, key, output) + ".part"
+            if getattr(geometry[output], "filename", None) == os.path.abspath(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError as err:
+                    logger.debug(f"Failed to remove `{tmp_path}`: {err}")
+
+    def _remove_stale(self, name, key):
+        """Remove the entries of an exercise with other keys."""
+        pattern = re.compile(
+            re.escape(name) + r"\.(?P<key>[0-9a-f]{16})\.(verts|kpnts)\.npy$"
+        )
+        for file in os.listdir(self.folder):
+            match = pattern.match(file)
+            if match and match.group("key") != key:
+                try:
+                    os.remove(os.path.join(self.folder, file))
+                except OSError as err:
+                    logger.debug(
+                        f"Failed to remove the stale cache file `{file}`: {err}"
+                    )
@@ -11,6 +11,30 @@ from .tf_smpl.batch_smpl import SMPL
 from .utils.log import logger
 
 
+def load_tflite_interpreter(model_path, num_threads=None):
+    """Load a TFLite model, with the lightweight `tflite_runtime` interpreter if it is installed.
+
+    Args:
+      model_path: the path of the TFLite model
+      num_threads: the number of threads of the interpreter, picked by TFLite if None.
+        Only `tflite_runtime` applies it, since the interpreter of tensorflow 1.15 has no `num_threads`.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+
+    try:
+        return Interpreter(model_path=model_path, num_threads=num_threads)
+    except TypeError:
+        # The interpreter of tensorflow 1.15 has no `num_threads` argument
+        logger.warning(
+            "The TFLite interpreter of tensorflow cannot set the number of threads, "
+            "install `tflite_runtime` to apply it"
+        )
+        return Interpreter(model_path=model_path)
+
+
 def Encoder_resnet(x, is_training=True, weight_decay=0.001, reuse=False):
     """
     Resnet v2-50
@@ -107,10 +131,17 @@ def get_encoder_fn_separate(model_type):
 
 
 class HMR(object):
-    def __init__(self, config, sess=None):
+    # The feeds of the locked shape for each stage, see `lock_shape`
+    _locked_feeds = None
+
+    def __init__(self, config, sess=None, batch_size=None, early_exit=True):
         """
         Args:
           config
+          sess: the session to restore the model in
+          batch_size: overrides the batch size of the config
+          early_exit: whether to build the early exit of the stages,
+            which is left out of the graphs exported to TFLite, since it has no control flow
         """
         self.config = config
         self.load_path = config.pretrained_path
@@ -122,17 +153,24 @@ class HMR(object):
             )
 
         # Data
-        self.batch_size = config.batch_size
+        self.batch_size = batch_size or config.batch_size
         self.img_size = config.img_size
 
         self.data_format = config.data_format
         self.smpl_model_path = config.smpl_model_path
 
         input_size = (self.batch_size, self.img_size, self.img_size, 3)
-        self.images_pl = tf.compat.v1.placeholder(tf.float32, shape=input_size)
+        self.images_pl = tf.compat.v1.placeholder(
+            tf.float32, shape=input_size, name="images"
+        )
 
         # Model Settings
         self.num_stage = config.num_stage
+        # Runtime settings of the iterative error feedback:
+        # the number of stages to run and the theta update norm below which it exits early
+        self.ief_stages = self.num_stage
+        self.ief_threshold = config.ief_threshold
+        self.early_exit = early_exit
         self.model_type = config.model_type
         self.joint_type = config.joint_type
         # Camera
@@ -143,7 +181,9 @@ class HMR(object):
         # Theta size: camera (3) + pose (24*3) + shape (10)
         self.total_params = self.num_cam + self.num_theta + 10
 
-        self.smpl = SMPL(self.smpl_model_path, joint_type=self.joint_type)
+        self.smpl = SMPL(
+            self.smpl_model_path, joint_type=self.joint_type, **config.smpl_options
+        )
 
         self.build_test_model_ief()
 
@@ -153,7 +193,14 @@ class HMR(object):
             self.sess = sess
 
         # Load data.
-        self.saver = tf.compat.v1.train.Saver()
+        # The SMPL variables are initialised from the shared SMPL parameters instead of the checkpoint
+        self.saver = tf.compat.v1.train.Saver(
+            var_list=[
+                var
+                for var in tf.compat.v1.global_variables()
+                if var not in self.smpl.variables
+            ]
+        )
         self.prepare()
 
     def build_test_model_ief(self):
@@ -168,7 +215,15 @@ class HMR(object):
             self.images_pl, is_training=False, reuse=False
         )
 
+        # The early exit is disabled by default, since no update norm is below 0
+        self.ief_threshold_pl = tf.compat.v1.placeholder_with_default(
+            0.0, shape=(), name="ief_threshold"
+        )
+        converged = tf.constant(False)
+
         # Start loop
+        self.all_shapes = []
+        self.all_shaped = []
         self.all_verts = []
         self.all_kps = []
         self.all_cams = []
@@ -181,23 +236,51 @@ class HMR(object):
             # ---- Compute outputs
             state = tf.concat([self.img_feat, theta_prev], 1)
 
-            if i == 0:
+            if i == 0 or not self.early_exit:
                 delta_theta, _ = threed_enc_fn(
-                    state, num_output=self.total_params, is_training=False, reuse=False
+                    state,
+                    num_output=self.total_params,
+                    is_training=False,
+                    reuse=i > 0,
                 )
+                # Compute new theta
+                theta_here = theta_prev + delta_theta
             else:
-                delta_theta, _ = threed_enc_fn(
-                    state, num_output=self.total_params, is_training=False, reuse=True
+
+                def refine(state=state, theta_prev=theta_prev):
+                    delta_theta, _ = threed_enc_fn(
+                        state,
+                        num_output=self.total_params,
+                        is_training=False,
+                        reuse=True,
+                    )
+                    return theta_prev + delta_theta
+
+                # Once converged, the remaining stages are skipped
+                theta_here = tf.cond(
+                    converged,
+                    lambda theta_prev=theta_prev: theta_prev,
+                    refine,
+                    name="ief_stage%d" % i,
                 )
 
-            # Compute new theta
-            theta_here = theta_prev + delta_theta
+            # The largest pose and shape update of the batch
+            delta_norm = tf.reduce_max(
+                tf.norm((theta_here - theta_prev)[:, self.num_cam :], axis=1)
+            )
+            converged = tf.logical_or(converged, delta_norm < self.ief_threshold_pl)
             # cam = N x 3, pose N x self.num_theta, shape: N x 10
             cams = theta_here[:, : self.num_cam]
             poses = theta_here[:, self.num_cam : (self.num_cam + self.num_theta)]
             shapes = theta_here[:, (self.num_cam + self.num_theta) :]
+            # The shape of the outputs can be locked by feeding it, see `lock_shape`
+            shapes = tf.compat.v1.placeholder_with_default(
+                shapes, shape=shapes.shape, name="shape_stage%d" % i
+            )
 
             verts, Js, joints = self.smpl(shapes, poses, get_skin=True)
+            self.all_shapes.append(shapes)
+            self.all_shaped.append((self.smpl.v_shaped, self.smpl.J_rest))
 
             # Project to 2D!
             pred_kp = self.proj_fn(Js, cams, name="proj_2d_stage%d" % i)
@@ -211,11 +294,47 @@ class HMR(object):
             # Finally update to end iteration.
             theta_prev = theta_here
 
+        # The tensors fetched in the predictions, for each number of stages
+        self.stage_outputs = [
+            {
+                "joints": self.all_kps[i],
+                "verts": self.all_verts[i],
+                "cams": self.all_cams[i],
+                "joints3d": self.all_joints[i],
+                "theta": self.final_thetas[i],
+            }
+            for i in range(self.num_stage)
+        ]
+        self.outputs = self.stage_outputs[-1]
+
     def prepare(self):
         logger.info("Restoring checkpoint %s..." % self.load_path)
         self.saver.restore(self.sess, self.load_path)
+        self.smpl.initialize(self.sess)
         self.mean_value = self.sess.run(self.mean_var)
 
+    def lock_shape(self, shape):
+        """
+        shape: 10, the SMPL shape to lock the outputs to, or None to unlock them.
+        The shaped template and the rest joints of the locked shape are computed once
+        and fed to the SMPL of each stage, so the predicted shape is ignored and the
+        shape blend shapes and the joint regression are skipped.
+        The predicted theta is not affected.
+        """
+        if shape is None:
+            self._locked_feeds = None
+            return
+
+        shapes = np.tile(np.asarray(shape, dtype=np.float32), [self.batch_size, 1])
+        # The SMPL of every stage is the same, so its shaped outputs are computed once
+        v_shaped, J_rest = self.sess.run(
+            self.all_shaped[0], {self.all_shapes[0]: shapes}
+        )
+        self._locked_feeds = [
+            {shape_pl: shapes, shaped[0]: v_shaped, shaped[1]: J_rest}
+            for shape_pl, shaped in zip(self.all_shapes, self.all_shaped)
+        ]
+
     def predict(self, images, get_theta=False):
         """
         images: num_batch, img_size, img_size, 3
@@ -238,28 +357,201 @@ class HMR(object):
                 results["joints3d"],
             )
 
-    def predict_dict(self, images):
+    def predict_dict(self, images, outputs=None):
         """
         images: num_batch, img_size, img_size, 3
         Preprocessed to range [-1, 1]
+        outputs: the names of the outputs to fetch, all of them if None.
         Runs the model with images.
+        Only the first `self.ief_stages` stages are run, since the later ones are not fetched,
+        and the stages stop early when the theta update is below `self.ief_threshold`.
+        Only the subgraph of the fetched outputs is run, so when neither `verts` nor `joints`
+        are fetched, the linear blend skinning of the mesh is skipped.
         """
         feed_dict = {
             self.images_pl: images,
+            self.ief_threshold_pl: self.ief_threshold,
             # self.theta0_pl: self.mean_var,
         }
-        fetch_dict = {
-            "joints": self.all_kps[-1],
-            "verts": self.all_verts[-1],
-            "cams": self.all_cams[-1],
-            "joints3d": self.all_joints[-1],
-            "theta": self.final_thetas[-1],
-        }
+        stage = min(max(self.ief_stages, 1), len(self.stage_outputs))
+        fetch_dict = self.stage_outputs[stage - 1]
+        if outputs is not None:
+            fetch_dict = {name: fetch_dict[name] for name in outputs}
+        if self._locked_feeds is not None:
+            feed_dict.update(self._locked_feeds[stage - 1])
 
         results = self.sess.run(fetch_dict, feed_dict)
 
         # Return joints in original image space.
-        joints = results["joints"]
-        results["joints"] = ((joints + 1) * 0.5) * self.img_size
+        if "joints" in results:
+            joints = results["joints"]
+            results["joints"] = ((joints + 1) * 0.5) * self.img_size
+
+        return results
+
+
+class FrozenHMR(HMR):
+    """The HMR model loaded from a frozen inference graph.
+
+    The graph is exported once with :func: `export_model.freeze_hmr`. It holds only the fetched outputs,
+    with the variables, the batch norms and the constants folded, so neither the slim graph
+    nor the checkpoint have to be loaded.
+    Only the outputs of the last stage are exported, so `ief_stages` has no effect,
+    while the early exit with `ief_threshold` is kept.
+    """
+
+    output_names = ("joints", "verts", "cams", "joints3d", "theta")
+
+    def __init__(self, config, graph_path, sess=None):
+        """
+        Args:
+          config
+          graph_path: the path of the frozen graph
+          sess: the session to run the model in
+        """
+        self.config = config
+        self.img_size = config.img_size
+
+        logger.info("Loading frozen graph %s..." % graph_path)
+        graph_def = tf.compat.v1.GraphDef()
+        with tf.io.gfile.GFile(graph_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+        tf.import_graph_def(graph_def, name="")
+
+        graph = tf.compat.v1.get_default_graph()
+        self.images_pl = graph.get_tensor_by_name("images:0")
+        self.ief_threshold_pl = graph.get_tensor_by_name("ief_threshold:0")
+        self.batch_size = self.images_pl.shape[0].value
+        self.outputs = {
+            name: graph.get_tensor_by_name("%s:0" % name) for name in self.output_names
+        }
+        self.stage_outputs = [self.outputs]
+        self.ief_stages = config.num_stage
+        self.ief_threshold = config.ief_threshold
+
+        if sess is None:
+            self.sess = tf.compat.v1.Session()
+        else:
+            self.sess = sess
+
+    def lock_shape(self, shape):
+        """The SMPL of the frozen graph is not fed, so the shape cannot be locked."""
+        if shape is not None:
+            logger.warning("The shape cannot be locked with the frozen graph")
+
+
+class TFLiteHMR(HMR):
+    """The HMR model run with the TFLite interpreter.
+
+    The encoder and the regressor are exported once with :func: `export_model.convert_tflite`,
+    optionally quantised. The interpreter predicts only the theta, and the rest of the outputs
+    are computed from it with SMPL in a tensorflow session, only when they are fetched.
+    The stages are exported without the early exit, so `ief_stages` and `ief_threshold` have no effect.
+    """
+
+    output_names = ("joints", "verts", "cams", "joints3d", "theta")
+
+    def __init__(self, config, model_path, sess=None, num_threads=None):
+        """
+        Args:
+          config
+          model_path: the path of the TFLite model
+          sess: the session to run SMPL in
+          num_threads: the number of threads of the interpreter
+        """
+        self.config = config
+        self.img_size = config.img_size
+        self.num_cam = 3
+        self.num_theta = 72
+        self.proj_fn = proj_util.batch_orth_proj_idrot
+
+        logger.info("Loading TFLite model %s..." % model_path)
+        self.interpreter = load_tflite_interpreter(model_path, num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = self.input_details["shape"][0]
+        self.ief_stages = config.num_stage
+        self.ief_threshold = config.ief_threshold
+
+        self.theta_pl = tf.compat.v1.placeholder(
+            tf.float32, shape=(self.batch_size, 85), name="theta"
+        )
+        cams = self.theta_pl[:, : self.num_cam]
+        poses = self.theta_pl[:, self.num_cam : (self.num_cam + self.num_theta)]
+        shapes = tf.compat.v1.placeholder_with_default(
+            self.theta_pl[:, (self.num_cam + self.num_theta) :],
+            shape=(self.batch_size, 10),
+            name="shape",
+        )
+
+        self.smpl = SMPL(
+            config.smpl_model_path,
+            joint_type=config.joint_type,
+            **config.smpl_options,
+        )
+        verts, Js, joints = self.smpl(shapes, poses, get_skin=True)
+        self.all_shapes = [shapes]
+        self.all_shaped = [(self.smpl.v_shaped, self.smpl.J_rest)]
+        self.outputs = {
+            "joints": self.proj_fn(Js, cams, name="proj_2d"),
+            "verts": verts,
+            "cams": cams,
+            "joints3d": joints,
+            "theta": self.theta_pl,
+        }
+        self.stage_outputs = [self.outputs]
+
+        if sess is None:
+            self.sess = tf.compat.v1.Session()
+        else:
+            self.sess = sess
+        self.smpl.initialize(self.sess)
+
+    def predict_theta(self, images):
+        """
+        images: num_batch, img_size, img_size, 3
+        Preprocessed to range [-1, 1]
+        Runs the interpreter, quantising the input and dequantising the output
+        when the model was exported with integer inputs and outputs.
+        """
+        input_details, output_details = self.input_details, self.output_details
+        if input_details["dtype"] != np.float32:
+            scale, zero_point = input_details["quantization"]
+            images = np.round(images / scale + zero_point).astype(
+                input_details["dtype"]
+            )
+        self.interpreter.set_tensor(input_details["index"], images)
+        self.interpreter.invoke()
+        theta = self.interpreter.get_tensor(output_details["index"])
+        if output_details["dtype"] != np.float32:
+            scale, zero_point = output_details["quantization"]
+            theta = (theta.astype(np.float32) - zero_point) * scale
+        return theta
+
+    def predict_dict(self, images, outputs=None):
+        """
+        images: num_batch, img_size, img_size, 3
+        Preprocessed to range [-1, 1]
+        outputs: the names of the outputs to fetch, all of them if None.
+        """
+        theta = self.predict_theta(images)
+        if outputs is None:
+            outputs = self.output_names
+
+        fetch_dict = {name: self.outputs[name] for name in outputs if name != "theta"}
+        results = {}
+        if fetch_dict:
+            feed_dict = {self.theta_pl: theta}
+            if self._locked_feeds is not None:
+                feed_dict.update(self._locked_feeds[0])
+            results = self.sess.run(fetch_dict, feed_dict)
+        if "theta" in outputs:
+            results["theta"] = theta
+
+        # Return joints in original image space.
+        if "joints" in results:
+            joints = results["joints"]
+            results["joints"] = ((joints + 1) * 0.5) * self.img_size
 
         return results
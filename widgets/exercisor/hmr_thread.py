@@ -2,13 +2,16 @@ import errno
 import os
 import threading
 
-import cv2
 import numpy as np
-import tensorflow as tf
 
 from .ml_thread import MLThread
-from .hmr_model import HMR
-from .utils.preprocess import process_image
+from .backends import create_hmr_backend
+from .capture_thread import CaptureThread
+from .ingest import IngestThread
+from .utils.preprocess import ImagePreprocessor
+from .utils.tracking import CropTracker, project_joints
+from .utils.motion import MotionGate
+from .utils.log import logger
 
 
 class HMRThread(MLThread):
@@ -24,45 +27,90 @@ class HMRThread(MLThread):
     output_fn: `callable`
         The function to call on the outputs for each prediction.
     save_fn: `callable`
-        Saves the predicted outputs for a specific exercise.
-    graph: `tensorflow.Graph`
-        The computational graph to be used.
-    sess: `tensorflow.Session`
-        The session to be used.
-    model: `models.HMR`
-        The HMR model implementation in tensorflow.
-    thetas: `list` [`lists`], (N x 82)
-        The 82 thetas for each frame to be saved when saving an exercise.
+        Saves the thetas of an exercise, ingested from a video file with :method: `ingest`.
     source: `str`
         The source stream to be used in the capture. Can be either 'cam' or a video file path.
+    preview_fn: `callable`
+        The function to call on the captured frames for the camera preview. If `None`, the preview is disabled.
+    preview_fps: `int`
+        The maximum number of frames per second sent to the camera preview.
+    requested_outputs: `set` [`str`]
+        The outputs of the HMR model that the consumer of :attr: `output_fn` needs, out of 'verts' and 'joints3d'.
+        The 'verts' are sent as `None` when they are not requested, so that the mesh skinning is skipped.
+    ief_stages: `int`
+        The number of iterative error feedback stages that the model runs, see :method: `set_ief`.
+    ief_threshold: `float`
+        The theta update norm below which the stages stop early, see :method: `set_ief`.
+    motion_gate: `bool`
+        Whether the previous outputs are reused on the frames where the scene has not changed,
+        when `model_cfg.motion_threshold` is set.
+    locked_shape: `numpy.ndarray`, (10)
+        The median shape of the user over the first `model_cfg.shape_lock_frames` predicted frames,
+        which the predicted mesh is locked to. `None` until enough frames are predicted.
     """
 
-    def __init__(self, model_cfg, save_fn, *args, **kwargs):
+    preview_fps = 10
+    default_backend = "auto"
+
+    def __init__(
+        self,
+        model_cfg,
+        save_fn,
+        *args,
+        ief_stages=0,
+        ief_threshold=None,
+        motion_gate=True,
+        **kwargs,
+    ):
         # Setup the session and load the hmr model
         self.model_cfg = model_cfg
+        self.ief_stages = ief_stages or model_cfg.num_stage
+        self.ief_threshold = (
+            model_cfg.ief_threshold if ief_threshold is None else ief_threshold
+        )
         self.img_size = model_cfg.img_size
         self.save_fn = save_fn
+        self._preprocess = ImagePreprocessor(self.img_size)
+        # Crop around the tracked person instead of the frame's center
+        self._tracker = CropTracker(self.img_size) if model_cfg.track_person else None
+        # Reuse the previous outputs when the scene has not changed
+        self._motion_gate = None
+        if motion_gate and model_cfg.motion_threshold > 0:
+            self._motion_gate = MotionGate(
+                model_cfg.motion_threshold, max_skipped=model_cfg.motion_max_skipped
+            )
+        self._last_outputs = None
+        self.preview_fn = None
+        self._last_preview = 0.0
+        self.requested_outputs = {"verts", "joints3d"}
+        self.locked_shape = None
+        self._shapes = []
+        self._reset_shape = threading.Event()
 
         self._cap_source = ""
         self.capture = "cam"
 
-        self._saving = threading.Event()
         super().__init__("HMR", *args, **kwargs)
 
     def _prepare_model(self):
-        """Create the tensorflow graph and session and load the model"""
-        self.graph = tf.Graph()
-        config = tf.compat.v1.ConfigProto()
-        config.gpu_options.allow_growth = True
-        self.sess = tf.compat.v1.Session(graph=self.graph, config=config)
-        with self.graph.as_default():
-            self.model = self.load_model()
-
-    def load_model(self):
-        """Load the HMR model"""
-        model = HMR(self.model_cfg, sess=self.sess)
-        self.thetas = []
-        return model
+        """Load the HMR model with the selected backend"""
+        self._load_backend(self.backend_name)
+
+    def _create_backend(self, name):
+        """Create the HMR backend. The 'auto' backend picks the fastest exported model."""
+        return create_hmr_backend(
+            name, self.model_cfg, self.intra_op_threads, self.inter_op_threads
+        )
+
+    def _warm_up(self, backend):
+        """Predict a blank image, with and without the mesh outputs."""
+        backend.set_ief(self.ief_stages, self.ief_threshold)
+        images = np.zeros((1, self.img_size, self.img_size, 3), dtype=np.float32)
+        for outputs in ({"verts", "joints3d"}, {"joints3d"}):
+            backend.predict(images, self._fetched_outputs(outputs))
+        # The new backend keeps the shape of the user
+        if self.locked_shape is not None:
+            backend.lock_shape(self.locked_shape)
 
     def _prepare_inputs(self):
         """
@@ -71,22 +119,50 @@ class HMRThread(MLThread):
         Returns
         -------
         `dict`
-            Contains the retrieval status and the current frame image.
+            Contains the retrieval status, the current frame image, the time it was grabbed,
+            the original frame's shape and the crop parameters.
             The retrieval status is a `bool`, which is `True` if the frame retrieval was successful, `False` otherwise.
             The frame image is an `numpy.ndarray`.
+            If the scene has not changed since the last prediction, it contains the `unchanged` flag
+            instead of the preprocessed frame.
         """
-        ret, frame = self.capture.read()
+        ret, frame, timestamp = self.capture.read()
 
         if ret:
-            cv2.imshow("frame", frame)
-            cv2.waitKey(1)
+            if (
+                self.preview_fn is not None
+                and timestamp - self._last_preview >= 1.0 / self.preview_fps
+            ):
+                self._last_preview = timestamp
+                self.preview_fn(frame)
+
+            if (
+                self._motion_gate is not None
+                and self._last_outputs is not None
+                and self._motion_gate.is_unchanged(frame)
+            ):
+                return {"ret": ret, "unchanged": True, "timestamp": timestamp}
 
-            frame, _ = process_image(frame, self.img_size)
-        inputs = {"ret": ret, "frame": frame}
+            frame_shape = frame.shape
+            if self._tracker is not None:
+                frame, proc_param = self._preprocess(
+                    frame, self._tracker.center, self._tracker.scale
+                )
+            else:
+                frame, proc_param = self._preprocess(frame)
+            inputs = {
+                "ret": ret,
+                "frame": frame,
+                "timestamp": timestamp,
+                "frame_shape": frame_shape,
+                "proc_param": proc_param,
+            }
+        else:
+            inputs = {"ret": ret, "frame": frame, "timestamp": timestamp}
         return inputs
 
     def _predict(self, inputs: np.ndarray):
-        """Display the input frame image and return the predictions, if the frame retrieval was successful.
+        """Return the predictions, if the frame retrieval was successful.
 
         Parameters
         ----------
@@ -97,28 +173,80 @@ class HMRThread(MLThread):
         -------
         `dict`
             The vertices and keypoints of the smpl mesh if the frame retrieval was successful.
-            If it was saving an exercise, at the end of the exercise returns the thetas for the whole exercise.
         """
+        if inputs.get("unchanged", False):
+            # The scene has not changed, so the previous outputs are reused
+            return self._last_outputs
+
         if inputs["ret"]:
-            joints, verts, cams, joints3d, theta = self.model.predict(
-                inputs["frame"], get_theta=True
-            )
+            if self._reset_shape.is_set():
+                self._reset_shape.clear()
+                self._unlock_shape()
+            results = self.backend.predict(inputs["frame"], self._fetched_outputs())
+
+            if self._collecting_shapes():
+                self._update_shape(results["theta"][0, -10:])
 
-            if self._saving.is_set():
-                self.thetas.append(theta[0, 3:])
+            if self._tracker is not None:
+                joints = project_joints(
+                    results["joints3d"][0], results["cams"][0], self.img_size
+                )
+                self._tracker.update(
+                    joints, inputs["proc_param"], inputs["frame_shape"]
+                )
 
-            outputs = {"verts": verts[0], "joints3d": joints3d[0]}
+            verts = results["verts"][0] if "verts" in results else None
+            outputs = {"verts": verts, "joints3d": results["joints3d"][0]}
+            self._last_outputs = outputs
             return outputs
-        else:
-            if self._saving.is_set():
-                self._saving.clear()
-                thetas = np.array(self.thetas)
-                self.thetas = []
-                self.pause()
-                return {"thetas": thetas}
+
+    def _fetched_outputs(self, requested_outputs=None):
+        """Returns the names of the HMR outputs needed for the next prediction.
+
+        Parameters
+        ----------
+        requested_outputs : `set` [`str`], optional
+            The outputs requested by the consumer. Defaults to :attr: `requested_outputs`.
+        """
+        if requested_outputs is None:
+            requested_outputs = self.requested_outputs
+        fetches = {"joints3d"} | set(requested_outputs)
+        if self._collecting_shapes():
+            fetches.add("theta")
+        if self._tracker is not None:
+            fetches.add("cams")
+        return fetches
+
+    def _collecting_shapes(self):
+        """Returns `True` if the shapes of the user are collected to lock the shape, `False` otherwise."""
+        return self.model_cfg.shape_lock_frames > 0 and self.locked_shape is None
+
+    def _update_shape(self, shape):
+        """Collect the predicted shape and lock the shape to the median, once enough frames are predicted.
+
+        The shape of the user does not change, so the locked mesh does not jitter with the noise
+        of the predicted shape, and the shape blend shapes are computed once.
+        """
+        self._shapes.append(shape)
+        if len(self._shapes) >= self.model_cfg.shape_lock_frames:
+            self.locked_shape = np.median(self._shapes, axis=0).astype(np.float32)
+            self._shapes = []
+            self.backend.lock_shape(self.locked_shape)
+            logger.debug(f"Locked the shape of the user to {self.locked_shape}")
+
+    def _unlock_shape(self):
+        """Unlock the shape and start collecting the shapes of the user again."""
+        self._shapes = []
+        if self.locked_shape is not None:
+            self.locked_shape = None
+            self.backend.lock_shape(None)
+
+    def reset_shape(self):
+        """Collect the shape of a new user, before the next prediction."""
+        self._reset_shape.set()
 
     def _process_outputs(self, outputs: dict):
-        """Depending on the type of output, save the exercise data or send the outputs to the renderer.
+        """Send the outputs to the renderer.
 
         Parameters
         ----------
@@ -127,32 +255,91 @@ class HMRThread(MLThread):
         """
         if outputs is None:
             return
-        if "thetas" in outputs.keys():
-            filename = os.path.basename(self._cap_source)
-            filename = os.path.splitext(filename)[0]
-            self.save_fn(filename, outputs["thetas"])
-        elif "verts" in outputs.keys() and "joints3d" in outputs.keys():
+        if "joints3d" in outputs.keys():
             self.output_fn(outputs["verts"], outputs["joints3d"])
 
     def _cleaning_up(self):
-        """Release the acquired capture and close the opencv windows."""
+        """Release the acquired capture."""
         self.capture.release()
-        cv2.destroyAllWindows()
+
+    def set_ief(self, stages=0, threshold=0.0):
+        """Trade the accuracy of the predictions for their latency, from the next prediction.
+
+        The frozen graph and the TFLite backends ignore the stages, and the TFLite backend
+        ignores the threshold too, see :method: `backends.HMRBackend.set_ief`.
+
+        Parameters
+        ----------
+        stages : `int`
+            The number of iterative error feedback stages to run. If 0, all the stages are run.
+        threshold : `float`
+            The theta update norm below which the stages stop early. 0 disables the early exit.
+        """
+        self.ief_stages = stages or self.model_cfg.num_stage
+        self.ief_threshold = threshold
+        backend = self.backend
+        if backend is not None:
+            backend.set_ief(self.ief_stages, self.ief_threshold)
 
     def pause(self):
-        """Close all the opencv windows."""
-        cv2.destroyAllWindows()
+        """Stop grabbing frames."""
+        self.capture.pause()
+        if self._motion_gate is not None:
+            logger.debug(
+                f"Skipped {self._motion_gate.skipped_frames} unchanged frames, "
+                f"predicted {self._motion_gate.processed_frames} frames"
+            )
         super().pause()
 
-    def save(self):
-        self.thetas = []
-        self._saving.set()
+    def resume(self):
+        """Resume grabbing frames."""
+        self.capture.resume()
+        super().resume()
+
+    def ingest(self, source, progress_fn=None):
+        """Save the exercise of a video file in the offline ingestion mode.
+
+        The video is predicted on a separate :class: `ingest.IngestThread`, with the backend
+        and the thread pools of this thread, and the thetas are saved with :attr: `save_fn` when the ingestion finishes.
+
+        Parameters
+        ----------
+        source : `str`
+            The path of the video file.
+        progress_fn : `callable`, optional
+            Called with the number of processed frames and the total frames of the video.
+
+        Raises
+        ------
+        FileNotFoundError
+            If no file was found on the :param: `source` path.
+        """
+        if not os.path.isfile(source):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+
+        self.cancel_ingest()
+        self._ingest_thread = IngestThread(
+            self.model_cfg,
+            source,
+            self.save_fn,
+            progress_fn,
+            backend=self.backend_name,
+            intra_op_threads=self.intra_op_threads,
+            inter_op_threads=self.inter_op_threads,
+        )
+
+    def cancel_ingest(self):
+        """Cancel the running ingestion, if there is one."""
+        if getattr(self, "_ingest_thread", None) is not None:
+            self._ingest_thread.stop_exec()
+            self._ingest_thread = None
 
     @property
     def capture(self):
-        """`cv2.VideoCapture`: The video capture stream.
+        """`capture_thread.CaptureThread`: The video capture stream.
 
         The capture source can be either 'cam' or a specified video file.
+        When set, the previous capture is released and a new capture thread starts grabbing frames.
 
         Raises
         ------
@@ -166,13 +353,16 @@ class HMRThread(MLThread):
         if self._cap_source == source:
             return
 
+        new_capture = CaptureThread(source)
+        if hasattr(self, "_capture"):
+            self._capture.release()
         self._cap_source = source
-        if self._cap_source == "cam":
-            self._capture = cv2.VideoCapture(2)
-        else:
-            if os.path.exists(self._cap_source):
-                self._capture = cv2.VideoCapture(self._cap_source)
-            else:
-                raise FileNotFoundError(
-                    errno.ENOENT, os.strerror(errno.ENOENT), self._cap_source
-                )
+        self._capture = new_capture
+        if self._tracker is not None:
+            self._tracker.reset()
+        if self._motion_gate is not None:
+            self._motion_gate.reset()
+        self._last_outputs = None
+        self.reset_shape()
+        if hasattr(self, "_resumed") and not self.is_paused():
+            self._capture.resume()
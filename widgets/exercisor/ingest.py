@@ -0,0 +1,347 @@
+import argparse
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from . import model_cfg
+from .backends import HMR_BACKENDS, create_hmr_backend, use_per_session_threads
+from .capture_thread import CaptureThread
+from .utils.preprocess import ImagePreprocessor
+from .utils.log import logger
+
+
+class VideoIngestor(object):
+    """Predicts the thetas of whole videos offline, feeding the HMR model in batches.
+
+    Unlike the :class: `hmr_thread.HMRThread`, the video is decoded as fast as possible,
+    on a separate capture thread, and there is no real-time pacing.
+
+    Attributes
+    ----------
+    batch_size : `int`
+        The number of frames fed to the HMR model in each prediction.
+        The exported models keep the batch size that they were exported with.
+    backend : `backends.HMRBackend`
+        The inference backend that runs the HMR model.
+    """
+
+    def __init__(
+        self,
+        model_cfg,
+        batch_size=None,
+        backend="tf_session",
+        intra_op_threads=0,
+        inter_op_threads=0,
+    ):
+        self.backend = create_hmr_backend(
+            backend,
+            model_cfg,
+            intra_op_threads,
+            inter_op_threads,
+            batch_size=batch_size or model_cfg.ingest_batch_size,
+        )
+        self.backend.load()
+        self.batch_size = self.backend.batch_size
+        img_size = model_cfg.img_size
+        self._preprocess = ImagePreprocessor(img_size)
+        self._batch = np.empty((self.batch_size, img_size, img_size, 3), np.float32)
+
+    def ingest(self, video_path, progress_fn=None, stop_event=None):
+        """Predict the thetas of each frame of a video.
+
+        Parameters
+        ----------
+        video_path : `str`
+            The path of the video file.
+        progress_fn : `callable`, optional
+            Called after each batch with the number of processed frames and the total frames of the video.
+        stop_event : `threading.Event`, optional
+            When set, the ingestion is cancelled.
+
+        Returns
+        -------
+        `numpy.ndarray`, (N x 82)
+            The 82 thetas for each of the N frames of the video,
+            or `None` if the ingestion was cancelled.
+        """
+        capture = CaptureThread(video_path, buffer_size=2 * self.batch_size)
+        total_frames = capture.get_frame_count()
+        capture.resume()
+
+        thetas = []
+        nframes = 0  # the frames of the current batch
+        nprocessed = 0
+        try:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    logger.info(f"Cancelled the ingestion of `{video_path}`")
+                    return None
+
+                ret, frame, _ = capture.read()
+                if ret:
+                    self._batch[nframes] = self._preprocess(frame)[0][0]
+                    nframes += 1
+
+                if nframes == self.batch_size or (not ret and nframes > 0):
+                    # Pad the last batch with copies of its last frame
+                    self._batch[nframes:] = self._batch[nframes - 1]
+                    results = self.backend.predict(self._batch, ("theta",))
+                    thetas.append(results["theta"][:nframes, 3:])
+                    nprocessed += nframes
+                    nframes = 0
+
+                    if progress_fn is not None:
+                        progress_fn(nprocessed, total_frames)
+
+                if not ret:
+                    break
+        finally:
+            capture.release()
+
+        if not thetas:
+            return np.empty((0, 82), dtype=np.float32)
+        return np.concatenate(thetas, axis=0)
+
+    def close(self):
+        """Release the resources of the backend."""
+        self.backend.close()
+
+
+class IngestThread(threading.Thread):
+    """Saves the exercise of a video file in the offline ingestion mode on a separate thread.
+
+    The HMR model is loaded when the thread starts and released when the ingestion finishes.
+
+    Attributes
+    ----------
+    model_cfg: `module`
+        The configuration options for the HMR model.
+    source: `str`
+        The path of the video file.
+    save_fn: `callable`
+        Saves the predicted thetas of the exercise.
+    progress_fn: `callable`
+        Called after each batch with the number of processed frames and the total frames of the video.
+    batch_size: `int`
+        The number of frames fed to the HMR model in each prediction.
+    backend: `str`
+        The name of the HMR backend, as in :func: `backends.create_hmr_backend`.
+    intra_op_threads: `int`
+        The number of threads that run each operation. If 0, the backend picks the number.
+    inter_op_threads: `int`
+        The number of operations that run in parallel. If 0, the backend picks the number.
+    """
+
+    def __init__(
+        self,
+        model_cfg,
+        source,
+        save_fn,
+        progress_fn=None,
+        batch_size=None,
+        backend="tf_session",
+        intra_op_threads=0,
+        inter_op_threads=0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.name = "IngestThread"
+        self.daemon = True
+
+        self.model_cfg = model_cfg
+        self.source = source
+        self.save_fn = save_fn
+        self.progress_fn = progress_fn
+        self.batch_size = batch_size
+        self.backend = backend
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+        self._stopped = threading.Event()
+        self.start()
+
+    def stop_exec(self):
+        """Cancels the ingestion."""
+        self._stopped.set()
+
+    def run(self):
+        """Ingest the video and save the predicted thetas."""
+        logger.info(f"Loading HMR to ingest `{self.source}`...")
+        ingestor = VideoIngestor(
+            self.model_cfg,
+            self.batch_size,
+            self.backend,
+            self.intra_op_threads,
+            self.inter_op_threads,
+        )
+        try:
+            thetas = ingestor.ingest(self.source, self.progress_fn, self._stopped)
+        finally:
+            ingestor.close()
+
+        if thetas is not None:
+            filename = os.path.splitext(os.path.basename(self.source))[0]
+            logger.info(f"Ingested {len(thetas)} frames of `{self.source}`")
+            self.save_fn(filename, thetas)
+
+
+VIDEO_EXTENSIONS = (".avi", ".m4v", ".mkv", ".mov", ".mp4", ".mpeg", ".mpg", ".webm")
+
+# The ingestor of each worker process of the pool
+_worker_ingestor = None
+
+
+def _init_worker(batch_size, backend, num_threads):
+    """Load the HMR model once for each worker process."""
+    global _worker_ingestor
+    _worker_ingestor = VideoIngestor(model_cfg, batch_size, backend, num_threads)
+
+
+def _ingest_file(task):
+    """Ingest a video on a worker process and save its thetas as `<name>.npy`.
+
+    Returns
+    -------
+    `tuple` [`str`, `int`]
+        The name of the exercise and its number of frames, or `None` frames if it was skipped.
+    """
+    video_path, exercises_path, overwrite = task
+    exercise_name = os.path.splitext(os.path.basename(video_path))[0]
+    exercise_path = os.path.join(exercises_path, f"{exercise_name}.npy")
+    if os.path.exists(exercise_path) and not overwrite:
+        return exercise_name, None
+
+    thetas = _worker_ingestor.ingest(video_path)
+
+    # Write to a temporary file first, so that an interrupted run leaves no partial exercises
+    tmp_path = f"{exercise_path}.part"
+    with open(tmp_path, "w+b") as f:
+        np.save(f, thetas)
+    os.replace(tmp_path, exercise_path)
+    return exercise_name, len(thetas)
+
+
+def ingest_folder(
+    video_dir,
+    exercises_path,
+    workers=None,
+    batch_size=None,
+    overwrite=False,
+    backend="tf_session",
+):
+    """Save the exercises of all the videos of a folder, spreading them across a process pool.
+
+    Each worker process holds its own HMR session and writes the thetas of each video
+    as `<name>.npy` in :param: `exercises_path`, the format that
+    :class: `exercise_controller.ExerciseController` loads.
+
+    Parameters
+    ----------
+    video_dir : `str`
+        The folder of the exercise videos.
+    exercises_path : `str`
+        The folder where the exercises' data will be saved.
+    workers : `int`, optional
+        The number of worker processes. Defaults to the number of cores.
+    batch_size : `int`, optional
+        The number of frames fed to the HMR model in each prediction.
+    overwrite : `bool`
+        Whether to ingest again the videos that have already been saved.
+    backend : `str`
+        The name of the HMR backend, as in :func: `backends.create_hmr_backend`.
+
+    Returns
+    -------
+    `dict` [`str`, `int`]
+        The number of frames of each saved exercise.
+    """
+    videos = sorted(
+        os.path.join(video_dir, file)
+        for file in os.listdir(video_dir)
+        if file.lower().endswith(VIDEO_EXTENSIONS)
+    )
+    if not videos:
+        logger.warning(f"No videos were found in `{video_dir}`")
+        return {}
+
+    os.makedirs(exercises_path, exist_ok=True)
+    ncores = os.cpu_count() or 1
+    workers = min(workers or ncores, len(videos))
+    # Split the cores between the workers, so that their sessions do not oversubscribe them
+    num_threads = max(ncores // workers, 1)
+    logger.info(
+        f"Ingesting {len(videos)} videos with {workers} workers of {num_threads} threads"
+    )
+
+    tasks = [(video, exercises_path, overwrite) for video in videos]
+    saved = {}
+    # Tensorflow is not fork-safe, so the workers are spawned
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, _init_worker, (batch_size, backend, num_threads)) as pool:
+        for exercise_name, nframes in pool.imap_unordered(_ingest_file, tasks):
+            if nframes is None:
+                logger.info(f"Skipped `{exercise_name}`, it has already been saved")
+                continue
+            saved[exercise_name] = nframes
+            logger.info(
+                f"Saved `{exercise_name}` ({nframes} frames) "
+                f"[{len(saved)}/{len(videos)}]"
+            )
+
+    return saved
+
+
+def main(argv=None):
+    use_per_session_threads()
+    parser = argparse.ArgumentParser(
+        description="Save the exercises of a folder of videos, without the Kivy window."
+    )
+    parser.add_argument("video_dir", help="the folder of the exercise videos")
+    parser.add_argument(
+        "-o",
+        "--exercises-path",
+        default="./widgets/exercisor/exercise_data/",
+        help="the folder where the exercises' data will be saved",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="the number of worker processes (default: the number of cores)",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=model_cfg.ingest_batch_size,
+        help="the number of frames in each HMR prediction",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["auto"] + list(HMR_BACKENDS),
+        default="tf_session",
+        help="the HMR backend, the exported models predict one frame at a time "
+        "(default: tf_session)",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="ingest again the videos that have already been saved",
+    )
+    args = parser.parse_args(argv)
+
+    ingest_folder(
+        args.video_dir,
+        args.exercises_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        overwrite=args.overwrite,
+        backend=args.backend,
+    )
+
+
+if __name__ == "__main__":
+    main()
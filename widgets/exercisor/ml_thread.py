@@ -1,14 +1,46 @@
 from abc import ABC, abstractclassmethod
+import os
 import threading
 import time
+from .utils.observable import Observable
 from .utils.log import logger
 
 
-class MLThread(ABC, threading.Thread):
+def parse_cpu_list(cpu_list):
+    """Parse a list of CPU cores, such as '0-2,5'.
+
+    Parameters
+    ----------
+    cpu_list : `str`
+        The comma separated cores or ranges of cores.
+
+    Returns
+    -------
+    `set` [`int`]
+        The cores of the list, or `None` if the list is empty.
+
+    Raises
+    ------
+    ValueError
+        If the list is not valid.
+    """
+    cpus = set()
+    for part in cpu_list.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus or None
+
+
+class MLThread(ABC, Observable, threading.Thread):
     """The abstract implementation of a machine learning module that will be run on a separate thread.
 
     The thread executes instantly when it is constructed so that the model will start loading
     and then it enters the paused state.
+    Loading includes a warm-up prediction, so that the first real prediction does not pay
+    the lazy initialisation of the backend. The observers are notified with the :attr: `status`
+    and the :attr: `progress` whenever the loading advances.
 
     Attributes
     ----------
@@ -18,9 +50,39 @@ class MLThread(ABC, threading.Thread):
         The name of the thread.
     target_fps : `int`
         The maximum number of predictions per second.
+    backend_name : `str`
+        The name of the inference backend of the model.
+    backend : `backends.InferenceBackend`
+        The inference backend that runs the model, or `None` until it is loaded.
+        While it is `None`, no predictions are made.
+    default_backend : `str`
+        The backend that is loaded instead, when the selected backend fails to load on startup.
+    intra_op_threads : `int`
+        The number of threads that run each operation of the backend. If 0, the backend picks the number.
+    inter_op_threads : `int`
+        The number of operations that the backend runs in parallel. If 0, the backend picks the number.
+    cpu_affinity : `set` [`int`]
+        The CPU cores that the thread and the threads of its backend run on.
+        If `None`, they run on the cores that the process was allowed when the thread was created.
+    status : `str` { 'loading', 'warming_up', 'ready', 'failed' }
+        The loading status of the model.
+    progress : `float`
+        The loading progress of the model, in range [0, 1].
     """
 
-    def __init__(self, model_name=None, target_fps=25, *args, **kwargs):
+    default_backend = None
+
+    def __init__(
+        self,
+        model_name=None,
+        target_fps=25,
+        backend=None,
+        intra_op_threads=0,
+        inter_op_threads=0,
+        cpu_affinity=None,
+        *args,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
         self.model_name = model_name
@@ -30,6 +92,19 @@ class MLThread(ABC, threading.Thread):
         self.target_fps = target_fps
         self.output_fn = None
 
+        self.backend_name = backend or self.default_backend
+        self.backend = None
+        self._next_backend = None
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cpu_affinity = cpu_affinity
+        # The affinity that the process inherited, e.g. from taskset or a cpuset, restored when none is set
+        self._inherited_affinity = (
+            os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+        )
+        self.status = "loading"
+        self.progress = 0.0
+
         self._resumed = threading.Event()
         self._running = threading.Event()
         self._running.set()
@@ -51,14 +126,99 @@ class MLThread(ABC, threading.Thread):
         """Returns `True` if the thread is paused, `False` otherwise."""
         return not self._resumed.is_set()
 
+    def set_backend(self, name):
+        """Switch to another inference backend, which is loaded on the thread before the next prediction."""
+        self._next_backend = name
+
+    def configure(self, intra_op_threads=0, inter_op_threads=0, cpu_affinity=None):
+        """Change the thread pools and the CPU affinity, reloading the backend before the next prediction."""
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cpu_affinity = cpu_affinity
+        if self._next_backend is None:
+            self._next_backend = self.backend_name
+
+    def _apply_cpu_affinity(self):
+        """Pin the calling thread to the :attr: `cpu_affinity` cores.
+
+        The threads that it creates afterwards inherit the affinity. The thread pools of the backend
+        are created when it is loaded, per session, see :func: `backends._create_session`.
+        The TFLite interpreter and NumPy's BLAS create their pools once per process instead,
+        so they keep the affinity and the size of their first use.
+        """
+        if not hasattr(os, "sched_setaffinity"):
+            if self.cpu_affinity is not None:
+                logger.warning("The CPU affinity is not supported on this platform")
+            return
+
+        cpus = self.cpu_affinity or self._inherited_affinity
+        try:
+            # On Linux, the pid 0 refers to the calling thread only
+            os.sched_setaffinity(0, cpus)
+        except (OSError, ValueError) as err:
+            logger.error(f"Failed to set the CPU affinity of {self.name}: {err}")
+
+    def is_ready(self):
+        """Returns `True` if the model has been loaded and warmed up, `False` otherwise."""
+        return self.status == "ready"
+
+    def _set_status(self, status, progress):
+        """Update the loading status and notify the observers."""
+        self.status, self.progress = status, progress
+        self.notify(status, progress)
+
+    def _load_backend(self, name):
+        """Create, load and warm up the inference backend, replacing the current one.
+
+        If the backend fails to load, the current backend is kept.
+        If there is no current backend, the :attr: `default_backend` is loaded instead.
+        """
+        self._set_status("loading", 0.0)
+        try:
+            backend = self._create_backend(name)
+            backend.load()
+            self._set_status("warming_up", 0.5)
+            start_time = time.time()
+            self._warm_up(backend)
+            logger.debug(
+                f"Warmed up {self.model_name} in {time.time() - start_time:.2f} seconds"
+            )
+        except Exception as err:
+            logger.error(
+                f"Failed to load the `{name}` {self.model_name} backend: {err}"
+            )
+            if self.backend is not None:
+                self._set_status("ready", 1.0)
+            elif name != self.default_backend:
+                self._load_backend(self.default_backend)
+            else:
+                self._set_status("failed", 0.0)
+            return
+
+        if self.backend is not None:
+            self.backend.close()
+        self.backend, self.backend_name = backend, name
+        logger.info(f"Running {self.model_name} with the `{backend.name}` backend")
+        self._set_status("ready", 1.0)
+
     def run(self, *args, **kwargs):
         """The execution method of the thread."""
         logger.info(f"Loading {self.model_name}...")
+        self._apply_cpu_affinity()
         self._prepare_model()
         logger.info(f"Loaded the {self.model_name} model")
 
         while self._running.is_set():
             self._resumed.wait()
+            if self._next_backend is not None:
+                name, self._next_backend = self._next_backend, None
+                self._apply_cpu_affinity()
+                self._load_backend(name)
+            if self.backend is None:
+                # No backend could be loaded, so wait for another one to be selected
+                time.sleep(1.0 / self.target_fps)
+                continue
+
             self._start_time = time.time()
             inputs = self._prepare_inputs()
             outputs = self._predict(inputs)
@@ -68,6 +228,8 @@ class MLThread(ABC, threading.Thread):
             time.sleep(max(1.0 / self.target_fps - (time.time() - self._start_time), 0))
 
         self._cleaning_up()
+        if self.backend is not None:
+            self.backend.close()
         logger.info(f"{self.name} has finished execution")
 
     @abstractclassmethod
@@ -75,6 +237,16 @@ class MLThread(ABC, threading.Thread):
         """Prepare and load the AI model."""
         pass
 
+    @abstractclassmethod
+    def _create_backend(self, name):
+        """Create the inference backend with the given name."""
+        pass
+
+    @abstractclassmethod
+    def _warm_up(self, backend):
+        """Run the backend on dummy inputs, for each set of outputs that the predictions fetch."""
+        pass
+
     @abstractclassmethod
     def _prepare_inputs(self):
         """Prepare the inputs that will be used in the current prediction."""
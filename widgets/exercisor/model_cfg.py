@@ -6,13 +6,38 @@ model_dir = os.path.join(
 pretrained_path = os.path.join(model_dir, "model.ckpt-667589")
 smpl_model_path = os.path.join(model_dir, "neutral_smpl_with_cocoplus_reg.pkl")
 smpl_faces_path = os.path.join(model_dir, "smpl_faces.npy")
+# Exported with `python -m widgets.exercisor.export_model frozen`
+frozen_graph_path = os.path.join(model_dir, "hmr_frozen.pb")
+# Exported with `python -m widgets.exercisor.export_model tflite`
+tflite_path = os.path.join(model_dir, "hmr.tflite")
+# The number of threads of the TFLite interpreter, only with `tflite_runtime`,
+# since the interpreter of tensorflow 1.15 cannot set them
+tflite_threads = 4
 
 model_type = "resnet_fc3_dropout"
 data_format = "NHWC"
 joint_type = "cocoplus"
 batch_size = 1
+ingest_batch_size = 8  # the batch size when saving exercises from videos
 img_size = 224
-num_stage = 3
+num_stage = 3  # the maximum number of iterative error feedback stages
+ief_threshold = (
+    0.0  # stop the stages when the theta update norm is below it (0 disables)
+)
+track_person = (
+    True  # crop around the person of the previous frame instead of the center
+)
+motion_threshold = (
+    2.0  # skip the frames that differ less from the last predicted one (0 disables)
+)
+motion_max_skipped = 25  # the maximum number of consecutive skipped frames
+shape_lock_frames = 0  # lock the shape to its median over the first frames (0 disables)
+# The approximations of the SMPL model, which trade accuracy for speed (0 disables them).
+# Check their error with `python -m widgets.exercisor.smpl_bench`
+smpl_options = {
+    "posedirs_rank": 0,  # the rank of the pose blend shapes, at most 207
+    "skinning_k": 0,  # the number of joints that influence each vertex, at most 24
+}
 
 keypoints_spec = [
     {"name": "jaw", "parent": "neck", "smpl_indx": 15, "hradius": 0.10},
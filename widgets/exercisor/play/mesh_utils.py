@@ -1,4 +1,10 @@
+import os
+from collections import deque
+
 import numpy as np
+import scipy.sparse
+
+from ..utils.log import logger
 
 
 def calc_face_norm(tri):
@@ -54,6 +60,133 @@ def extract_norms_and_indices(verts, faces):
     return vert_norms, indices
 
 
+def decimate_faces(faces, rings=1):
+    """Decimate a triangle mesh by clustering its vertices over its edges.
+
+    The clusters are seeded greedily along a front that sweeps the mesh, and each seed takes
+    the vertices within `rings` edges of it that are not clustered yet. The seeds are the vertices
+    of the decimated mesh and each face is remapped to the seeds of its vertices, dropping the faces
+    that collapse to a line or a point and the duplicates. Only the topology is used,
+    so the decimated mesh holds for every shape and pose of the full one.
+
+    Parameters
+    ----------
+    faces : array_like (F x 3)
+        The 3 vertices' indices defining the F triangles of the full mesh.
+    rings : `int`
+        The number of edges around each seed whose vertices merge to it.
+
+    Returns
+    -------
+    vertices : `numpy.ndarray` (M)
+        The indices of the M kept vertices in the full mesh, in ascending order.
+    faces : `numpy.ndarray` (G x 3)
+        The 3 kept vertices' indices, into `vertices`, defining the G triangles.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    num_vertices = faces.max() + 1
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    adjacency = scipy.sparse.coo_matrix(
+        (np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])),
+        shape=(num_vertices, num_vertices),
+    )
+    adjacency = (adjacency + adjacency.T).tocsr()
+    indptr, neighbours = adjacency.indptr, adjacency.indices
+
+    cluster = np.full(num_vertices, -1, dtype=np.int64)
+    is_seed = np.zeros(num_vertices, dtype=bool)
+    # The candidate seeds, just outside the clustered part of the mesh
+    candidates = deque()
+    next_vertex = 0
+    while True:
+        while candidates and cluster[candidates[0]] >= 0:
+            candidates.popleft()
+        if candidates:
+            seed = candidates.popleft()
+        else:
+            # Start a new front, on a part of the mesh that is not connected to the clustered ones
+            while next_vertex < num_vertices and cluster[next_vertex] >= 0:
+                next_vertex += 1
+            if next_vertex == num_vertices:
+                break
+            seed = next_vertex
+
+        is_seed[seed] = True
+        cluster[seed] = seed
+        ring = [seed]
+        for _ in range(rings):
+            next_ring = []
+            for vertex in ring:
+                for neighbour in neighbours[indptr[vertex] : indptr[vertex + 1]]:
+                    if cluster[neighbour] < 0:
+                        cluster[neighbour] = seed
+                        next_ring.append(neighbour)
+            ring = next_ring
+        for vertex in ring:
+            candidates.extend(neighbours[indptr[vertex] : indptr[vertex + 1]])
+
+    vertices = np.flatnonzero(is_seed)
+    # Remap the seeds to their order in the kept vertices
+    remap = np.cumsum(is_seed) - 1
+    faces = remap[cluster[faces]]
+    faces = faces[
+        (faces[:, 0] != faces[:, 1])
+        & (faces[:, 1] != faces[:, 2])
+        & (faces[:, 2] != faces[:, 0])
+    ]
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    faces = faces[np.sort(first)]
+    return vertices.astype(np.int32), faces.astype(np.int32)
+
+
+def decimated_faces_path(faces_path, rings):
+    """Returns the path of the cached decimated topology of a mesh."""
+    return f"{os.path.splitext(faces_path)[0]}_lod{rings}.npz"
+
+
+def load_decimated_faces(faces_path, rings):
+    """Load the decimated topology of a mesh from the cache or compute and cache it.
+
+    Parameters
+    ----------
+    faces_path : `str`
+        The path of the `.npy` faces of the full mesh.
+    rings : `int`
+        The number of edges around each kept vertex whose vertices merge to it.
+
+    Returns
+    -------
+    `tuple` [`numpy.ndarray`, `numpy.ndarray`]
+        The (M) indices of the kept vertices and the (G x 3) decimated faces, as in `decimate_faces`.
+    """
+    faces = np.load(faces_path)
+    path = decimated_faces_path(faces_path, rings)
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as lod:
+                vertices, lod_faces = lod["vertices"], lod["faces"]
+                num_faces = int(lod["num_faces"])
+            if num_faces == len(faces) and lod_faces.max() < len(vertices):
+                return vertices, lod_faces
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning(f"Failed to load the decimated mesh `{path}`: {err}")
+
+    vertices, lod_faces = decimate_faces(faces, rings)
+    logger.info(
+        f"Decimated the mesh to {len(vertices)} vertices and {len(lod_faces)} faces, "
+        f"from {faces.max() + 1} and {len(faces)}"
+    )
+    try:
+        # Write to a temporary file first, so that no partial cache is left
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vertices=vertices, faces=lod_faces, num_faces=len(faces))
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logger.warning(f"Failed to cache the decimated mesh: {err}")
+    return vertices, lod_faces
+
+
 class GLMeshData(object):
     """Holds the data required to render a 3D mesh.
 
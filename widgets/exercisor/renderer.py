@@ -46,10 +46,14 @@ class Renderer(Widget):
     _nframes = NumericProperty(-1)
     _zoom_speed = 0.03
 
-    def __init__(self, smpl_faces_path=None, keypoints_spec=None, obj_mesh_path=None):
+    def __init__(
+        self, smpl_faces_path=None, keypoints_spec=None, obj_mesh_path=None, lod=None
+    ):
 
+        self._smpl_lod = None
         if smpl_faces_path is not None:
             self._smpl_faces = np.load(smpl_faces_path)
+            self.set_lod(lod)
 
         if keypoints_spec is not None:
             self.keypoints_spec = keypoints_spec.copy()
@@ -101,6 +105,20 @@ class Renderer(Widget):
 
         self.reset_highlight()
 
+    def set_lod(self, lod):
+        """Set the level of detail of the SMPL mesh, which applies from the next scene.
+
+        The decimated mesh keeps a subset of the SMPL vertices, so the vertices of each frame
+        are packed, shaded and uploaded only for that subset.
+
+        Parameters
+        ----------
+        lod : `tuple` [`numpy.ndarray`] or `None`
+            The kept vertices and the faces of the decimated mesh,
+            as loaded by :func: `mesh_utils.load_decimated_faces`. `None` renders the full mesh.
+        """
+        self._smpl_lod = lod
+
     def setup_scene(self, rendered_obj, opts: dict = {}):
         self.curr_obj = rendered_obj
         self._recalc_normals = True
@@ -178,8 +196,13 @@ class Renderer(Widget):
         )
 
     def _create_smpl_mesh(self):
-        verts = np.random.rand(6890, 3) * 2 - 1
-        self._mesh_data = GLMeshData(vertices=verts, faces=self._smpl_faces)
+        if self._smpl_lod is None:
+            self._mesh_lod, faces = None, self._smpl_faces
+            verts = np.random.rand(6890, 3) * 2 - 1
+        else:
+            self._mesh_lod, faces = self._smpl_lod
+            verts = np.random.rand(len(self._mesh_lod), 3) * 2 - 1
+        self._mesh_data = GLMeshData(vertices=verts, faces=faces)
         self._curr_mode = "triangles"
         self._mesh = Mesh(
             vertices=self._mesh_data.verts_gl,
@@ -329,12 +352,17 @@ class Renderer(Widget):
         Parameters
         ----------
         vertices: `numpy.array`, (N x 3)
-            The 3D coordinates of the mesh's N vertices.
+            The 3D coordinates of the mesh's N vertices, or `None` if only the keypoints were predicted.
         keypoints : `numpy.array`, (24 x 3)
             The 3D coordinates of the 24 SMPL keypoints.
         """
         if not hasattr(self, "_mesh"):
             return
+        if self.curr_obj == "smpl_mesh" and vertices is None:
+            # The mesh was not predicted for this frame
+            return
+        if self.curr_obj == "smpl_mesh" and self._mesh_lod is not None:
+            vertices = vertices[self._mesh_lod]
 
         if self._recalc_normals and self.curr_obj == "smpl_mesh":
             self._mesh_data.populate_normals_and_indices(vertices)
@@ -0,0 +1,341 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from . import model_cfg
+from .backends import SMPL_BACKENDS, create_smpl_backend
+from .tf_smpl import np_lbs
+from .tf_smpl.smpl_params import load_smpl_params
+from .utils.log import logger
+
+
+def sample_thetas(num_frames, seed=0):
+    """Returns random SMPL thetas, with plausible poses and shapes.
+
+    Returns
+    -------
+    `numpy.ndarray`, (num_frames x 82)
+        The 72 pose and the 10 shape parameters of each frame.
+    """
+    rng = np.random.default_rng(seed)
+    pose = rng.normal(scale=0.2, size=(num_frames, 72))
+    shape = rng.normal(scale=0.5, size=(num_frames, 10))
+    return np.concatenate([pose, shape], axis=1).astype(np.float32)
+
+
+def _batches(thetas, batch_size):
+    """Split the thetas into full batches, repeating the frames when they are fewer than a batch."""
+    if len(thetas) < batch_size:
+        thetas = np.resize(thetas, (batch_size, thetas.shape[1]))
+    nbatches = len(thetas) // batch_size
+    return thetas[: nbatches * batch_size].reshape(nbatches, batch_size, -1)
+
+
+def run_backend(name, thetas, batch_size=1, repeats=1, smpl_options=None, outputs=None):
+    """Predict the thetas with a SMPL backend and time it.
+
+    Parameters
+    ----------
+    name : `str`
+        The name of the SMPL backend.
+    thetas : `numpy.ndarray`, (N x 82)
+        The thetas of the frames.
+    batch_size : `int`
+        The number of frames in each prediction.
+    repeats : `int`
+        The number of times to predict all the frames.
+    smpl_options : `dict`
+        The keyword arguments of the SMPL model, its approximations.
+    outputs : `iterable` [`str`], optional
+        The outputs to predict. If `None`, all the outputs are predicted.
+
+    Returns
+    -------
+    `tuple` [`dict`, `float`]
+        The outputs of each frame and the mean time in seconds of a prediction.
+    """
+    backend = create_smpl_backend(
+        name,
+        model_cfg.smpl_model_path,
+        model_cfg.joint_type,
+        batch_size,
+        smpl_options=smpl_options,
+    )
+    backend.load()
+    batches = _batches(thetas, batch_size)
+    try:
+        # The first prediction includes the lazy initialisation, so it is not timed
+        backend.predict(batches[0], outputs)
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            results = [backend.predict(batch, outputs) for batch in batches]
+        elapsed = (time.perf_counter() - start_time) / (repeats * len(batches))
+    finally:
+        backend.close()
+
+    outputs = {
+        key: np.concatenate([result[key] for result in results]) for key in results[0]
+    }
+    return outputs, elapsed
+
+
+def _time(fn, runs):
+    """Returns the mean time in seconds of a call of fn, after a first untimed one."""
+    fn()
+    start_time = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start_time) / runs
+
+
+def time_regressors(batch_size, runs=100):
+    """Time the dense and the gathered joint regressions of a SMPL call.
+
+    A SMPL call regresses the 24 joints from the shaped vertices and the cocoplus keypoints
+    from the posed vertices, which is timed with the dense regressors, one matmul per coordinate,
+    and with the gathered ones, one step for all the coordinates.
+
+    Parameters
+    ----------
+    batch_size : `int`
+        The number of frames in each SMPL call.
+    runs : `int`
+        The number of timed calls.
+
+    Returns
+    -------
+    `dict` [`str`, `tuple`]
+        The mean dense and gathered times in seconds of the `tf_session` and `numpy` backends.
+    """
+    import tensorflow as tf
+    from .tf_smpl import batch_lbs
+
+    params = load_smpl_params(model_cfg.smpl_model_path)
+    regressors = [
+        (params.J_regressor, params.J_regressor_indices, params.J_regressor_weights),
+        (params.cocoplus_regressor, params.cocoplus_indices, params.cocoplus_weights),
+    ]
+    verts = np.random.default_rng(0).normal(size=(batch_size, 6890, 3))
+    verts = verts.astype(np.float32)
+
+    times = {}
+    graph = tf.Graph()
+    with graph.as_default():
+        verts_pl = tf.compat.v1.placeholder(tf.float32, verts.shape)
+        dense, gathered = [], []
+        for regressor, indices, weights in regressors:
+            dense.append(
+                tf.stack(
+                    [tf.matmul(verts_pl[:, :, i], regressor) for i in range(3)],
+                    axis=2,
+                )
+            )
+            gathered.append(batch_lbs.batch_regress(verts_pl, indices, weights))
+        with tf.compat.v1.Session(graph=graph) as sess:
+            times["tf_session"] = tuple(
+                _time(lambda: sess.run(fetches, {verts_pl: verts}), runs)
+                for fetches in (dense, gathered)
+            )
+
+    times["numpy"] = (
+        _time(
+            lambda: [
+                np.swapaxes(np.swapaxes(verts, 1, 2) @ regressor, 1, 2)
+                for regressor, _, _ in regressors
+            ],
+            runs,
+        ),
+        _time(
+            lambda: [
+                np_lbs.batch_regress(verts, indices, weights)
+                for _, indices, weights in regressors
+            ],
+            runs,
+        ),
+    )
+    return times
+
+
+def bench_regressors(batch_sizes, runs=100):
+    """Log the saving of the gathered joint regressors in the playback and in the HMR graphs."""
+    params = load_smpl_params(model_cfg.smpl_model_path)
+    logger.info(
+        f"The regressors use {len(params.J_regressor_indices)} and "
+        f"{len(params.cocoplus_indices)} of the 6890 vertices"
+    )
+    for batch_size in sorted(set(batch_sizes) | {model_cfg.batch_size}):
+        for name, (dense, gathered) in time_regressors(batch_size, runs).items():
+            message = (
+                f"{name} (batch {batch_size}): {dense * 1000:.3f} ms dense, "
+                f"{gathered * 1000:.3f} ms gathered per SMPL call"
+            )
+            if name == "tf_session" and batch_size == model_cfg.batch_size:
+                # The HMR graph calls SMPL once per iterative error feedback stage
+                saving = (dense - gathered) * model_cfg.num_stage
+                message += f", {saving * 1000:.3f} ms saved per HMR prediction"
+            logger.info(message)
+
+
+def bench_joints(thetas, backends, batch_sizes, repeats=1):
+    """Log the speed of predicting only the keypoints and their distance from the regressed joints.
+
+    The keypoints are the 24 joints of the forward kinematics, which are the same whether the mesh is
+    skinned or not. They differ from the joints regressed from the skinned mesh, since the pose
+    blend shapes and the skinning move the mesh around the joints, and that difference is reported.
+    """
+    from .tf_smpl.np_smpl import NumpySMPL
+
+    for batch_size in batch_sizes:
+        for name in backends:
+            _, full = run_backend(name, thetas, batch_size, repeats)
+            _, joints_only = run_backend(
+                name, thetas, batch_size, repeats, outputs=("keypoints",)
+            )
+            logger.info(
+                f"{name} (batch {batch_size}): {full * 1000:.2f} ms with the mesh, "
+                f"{joints_only * 1000:.2f} ms for only the keypoints"
+            )
+
+    smpl = NumpySMPL(model_cfg.smpl_model_path, model_cfg.joint_type)
+    verts, _, keypoints = smpl(thetas[:, 72:], thetas[:, :72], get_skin=True)
+    regressed = np_lbs.batch_regress(verts, smpl.J_regressor_indices, smpl.J_regressor)
+    max_error, mean_error = compare({"keypoints": keypoints}, {"keypoints": regressed})[
+        "keypoints"
+    ]
+    logger.info(
+        f"The keypoints are {max_error:.2f} mm max, {mean_error:.2f} mm mean "
+        "from the joints regressed from the mesh"
+    )
+
+
+def compare(outputs, reference):
+    """Returns the max and mean errors in mm of each output against the reference outputs."""
+    errors = {}
+    for key in reference:
+        if key not in outputs:
+            continue
+        distances = np.linalg.norm(outputs[key] - reference[key], axis=-1) * 1000
+        errors[key] = (float(distances.max()), float(distances.mean()))
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the speed and the outputs of the SMPL backends."
+    )
+    parser.add_argument(
+        "-e",
+        "--exercise",
+        help="the thetas of an exercise (default: random thetas)",
+    )
+    parser.add_argument(
+        "-n", "--frames", type=int, default=64, help="the number of random frames"
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(SMPL_BACKENDS),
+        default=list(SMPL_BACKENDS),
+        help="the backends to compare, the first one is the reference",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 16],
+        help="the number of frames in each prediction",
+    )
+    parser.add_argument(
+        "-r", "--repeats", type=int, default=5, help="the repeats of the frames"
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="the max error in mm of a matching backend (default: 0.1)",
+    )
+    parser.add_argument(
+        "--posedirs-ranks",
+        type=int,
+        nargs="+",
+        default=[],
+        help="the ranks of the pose blend shapes to report the error of",
+    )
+    parser.add_argument(
+        "--skinning-ks",
+        type=int,
+        nargs="+",
+        default=[],
+        help="the numbers of skinning joints per vertex to report the error of",
+    )
+    parser.add_argument(
+        "--joints",
+        action="store_true",
+        help="time the predictions of only the keypoints instead",
+    )
+    parser.add_argument(
+        "--regressors",
+        action="store_true",
+        help="time the dense and the gathered joint regressors instead",
+    )
+    args = parser.parse_args(argv)
+
+    if args.regressors:
+        bench_regressors(args.batch_sizes)
+        return
+
+    if args.exercise is not None:
+        thetas = np.load(args.exercise).astype(np.float32)
+    else:
+        thetas = sample_thetas(args.frames)
+
+    if args.joints:
+        bench_joints(thetas, args.backends, args.batch_sizes, args.repeats)
+        return
+
+    # The exact model first, then its approximations, which are compared to it
+    # but are not expected to match it
+    configurations = (
+        [{}]
+        + [{"posedirs_rank": rank} for rank in args.posedirs_ranks]
+        + [{"skinning_k": k} for k in args.skinning_ks]
+    )
+
+    matching = True
+    for batch_size in args.batch_sizes:
+        reference = None
+        for smpl_options in configurations:
+            for name in args.backends:
+                outputs, elapsed = run_backend(
+                    name, thetas, batch_size, args.repeats, smpl_options
+                )
+                label = "".join(
+                    f", {key} {value}" for key, value in smpl_options.items()
+                )
+                message = (
+                    f"{name}{label} (batch {batch_size}): "
+                    f"{elapsed * 1000:.2f} ms per prediction, "
+                    f"{batch_size / elapsed:.0f} frames per second"
+                )
+                if reference is None:
+                    reference = outputs
+                else:
+                    for key, (max_error, mean_error) in compare(
+                        outputs, reference
+                    ).items():
+                        message += f", {key} error {max_error:.4f} mm max, {mean_error:.4f} mm mean"
+                        if not smpl_options:
+                            matching &= max_error <= args.tolerance
+                logger.info(message)
+
+    if not matching:
+        logger.error(f"The outputs differ by more than {args.tolerance} mm")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
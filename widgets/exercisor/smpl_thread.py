@@ -1,8 +1,9 @@
+import time
+
 import numpy as np
-import tensorflow as tf
 
 from .ml_thread import MLThread
-from .tf_smpl.batch_smpl import SMPL
+from .backends import create_smpl_backend
 from .utils.log import logger
 
 
@@ -21,71 +22,146 @@ class SMPLThread(MLThread):
         The function to call on the outputs for each prediction.
     frame_index: int
         The current frame of the exercise playback.
-    graph: tensorflow.Graph
-        The computational graph to be used.
-    sess: tensorflow.Session
-        The session to be used.
-    smpl: tf_smpl.batch_smpl.SMPL
-        The SMPL model implementation in tensorflow.
-    thetas: tensorflow.Tensor
-        The input tensor that holds the pose and shape coefficients for the SMPL model.
-    verts: tensorflow.Tensor
-        The output tensor that holds the vertices of the smpl mesh.
-    joints: tensorflow.Tensor
-        The output tensor that holds the 24 keypoints of the smpl mesh.
+    precompute_batch_size: int
+        The number of frames in each prediction, when the geometry of the exercise is precomputed.
+    geometry_cache: geometry_cache.GeometryCache
+        Stores the precomputed geometry of the exercises on disk. If None, the geometry is always computed.
+    exercise_name: str
+        The name of the current exercise, under which its geometry is cached.
+    smpl_options: dict
+        The keyword arguments of the SMPL model, its approximations.
+    requested_outputs: set
+        The outputs that the consumer of `output_fn` needs, out of 'vertices' and 'keypoints'.
+        When the vertices are not requested, only the keypoints are computed, without skinning the mesh,
+        and the vertices are sent as None.
     """
 
-    def __init__(self, smpl_model_path, joint_type, *args, **kwargs):
+    default_backend = "tf_session"
+    precompute_batch_size = 32
+
+    def __init__(
+        self,
+        smpl_model_path,
+        joint_type,
+        *args,
+        geometry_cache=None,
+        smpl_options=None,
+        **kwargs,
+    ):
         self._smpl_model_path = smpl_model_path
         self._joint_type = joint_type
+        self.smpl_options = smpl_options
+        self.geometry_cache = geometry_cache
+        self.exercise_name = None
+        self._geometry = None
+        self._requested_outputs = {"vertices", "keypoints"}
         super().__init__("SMPL", *args, **kwargs)
 
     def _prepare_model(self):
-        """Create the tensorflow graph and session and build the SMPL model."""
-        self._graph = tf.Graph()
-        config = tf.compat.v1.ConfigProto()
-        config.gpu_options.allow_growth = True
-        self._sess = tf.compat.v1.Session(graph=self._graph, config=config)
-        with self._graph.as_default():
-            self._build_model()
-
-    def _build_model(self):
-        """Load the SMPL model, create the input and output tensors and initialise the session."""
-        self.smpl = SMPL(self._smpl_model_path, self._joint_type)
-        # Thetas are 10 shape coefficients of SMPL
-        # and 72 pose variables holding the rotation of 24 joints in axis angle format
-        self.thetas = tf.compat.v1.placeholder(tf.float32, shape=(1, 82))
-
-        pose, shape = self.thetas[:, :72], self.thetas[:, 72:]
-        self.verts, _, self.joints = self.smpl(shape, pose, get_skin=True)
-
-        init = tf.compat.v1.global_variables_initializer()
-        self._sess.run(init)
+        """Load the SMPL model with the selected backend."""
+        self._load_backend(self.backend_name)
+
+    def _create_backend(self, name):
+        """Create the SMPL backend."""
+        return create_smpl_backend(
+            name,
+            self._smpl_model_path,
+            self._joint_type,
+            batch_size=self.precompute_batch_size,
+            intra_op_threads=self.intra_op_threads,
+            inter_op_threads=self.inter_op_threads,
+            smpl_options=self.smpl_options,
+        )
+
+    def _warm_up(self, backend):
+        """Predict the rest pose."""
+        backend.predict(np.zeros((1, 82), dtype=np.float32))
 
     def _prepare_inputs(self):
-        """Get the current frame's thetas and add the batch dimension."""
+        """Precompute the geometry of the exercise, if it has changed, and get the current frame's index."""
         if not hasattr(self, "exercise"):
             return
-        thetas = self.exercise[self.frame_index]
-        thetas = np.expand_dims(thetas, axis=0)
-        return thetas
+        if self._geometry is None:
+            self._precompute(self.exercise)
+        return self.frame_index
+
+    def _precompute(self, exercise):
+        """Predict the requested outputs of every frame of the exercise in batches.
 
-    def _predict(self, thetas):
-        """Create the inputs and expected outputs and run the prediction."""
-        if thetas is None:
+        The precomputation is abandoned if the exercise or the requested outputs change in the meantime.
+        If the geometry of the exercise has been cached, it is loaded instead, and otherwise it is computed
+        straight into the files of the cache, so that it is not held on the heap.
+        """
+        name = self.exercise_name
+        requested_outputs = set(self._requested_outputs)
+        cached = self.geometry_cache is not None and name is not None
+        if cached:
+            geometry = self.geometry_cache.load(name, exercise, requested_outputs)
+            if geometry is not None:
+                if (
+                    exercise is self._exercise
+                    and requested_outputs == self._requested_outputs
+                ):
+                    self._geometry = geometry
+                logger.debug(f"Loaded the cached geometry of `{name}`")
+                return
+
+        start_time = time.time()
+        geometry = {}
+        for start in range(0, len(exercise), self.precompute_batch_size):
+            if (
+                exercise is not self._exercise
+                or requested_outputs != self._requested_outputs
+            ):
+                if cached:
+                    self.geometry_cache.discard(name, exercise, geometry)
+                return
+            outputs = self.backend.predict(
+                exercise[start : start + self.precompute_batch_size],
+                requested_outputs,
+            )
+            for key, values in outputs.items():
+                if key not in geometry:
+                    shape = (len(exercise),) + values.shape[1:]
+                    array = None
+                    if cached:
+                        array = self.geometry_cache.create(name, exercise, key, shape)
+                    geometry[key] = (
+                        array if array is not None else np.empty(shape, np.float32)
+                    )
+                geometry[key][start : start + len(values)] = values
+
+        if (
+            exercise is self._exercise
+            and requested_outputs == self._requested_outputs
+            and geometry
+        ):
+            if cached:
+                geometry = self.geometry_cache.save(name, exercise, geometry)
+            self._geometry = geometry
+            logger.debug(
+                f"Precomputed {len(exercise)} frames in {time.time() - start_time:.2f} seconds"
+            )
+
+    def _predict(self, frame_index):
+        """Get the precomputed geometry of the current frame."""
+        # The geometry is reset on the main thread, so it is read once
+        geometry = self._geometry
+        if frame_index is None or geometry is None:
             return
 
-        feed_dict = {self.thetas: thetas}
-        fetch_dict = {"vertices": self.verts, "keypoints": self.joints}
-        outputs = self._sess.run(fetch_dict, feed_dict)
-        return outputs
+        return {
+            key: values[frame_index : frame_index + 1]
+            for key, values in geometry.items()
+        }
 
     def _process_outputs(self, outputs):
         """Run the specified function with the outputs of the prediction and go to the next frame."""
         if not outputs:
             return
         frame = {"index": self.frame_index, "timestamp": self._start_time}
-        self.output_fn(outputs["vertices"][0], outputs["keypoints"][0], frame)
+        vertices = outputs["vertices"][0] if "vertices" in outputs else None
+        self.output_fn(vertices, outputs["keypoints"][0], frame)
         self.frame_index = (self.frame_index + 1) % len(self.exercise)
 
     def _cleaning_up(self):
@@ -102,6 +178,31 @@ class SMPLThread(MLThread):
     @exercise.setter
     def exercise(self, ex):
         self._exercise = ex
+        # The geometry of the new exercise is precomputed before its next frame
+        self._geometry = None
+
+    @property
+    def geometry(self):
+        """`dict` [`str`, `numpy.ndarray`]: The precomputed `vertices` (N x 6890 x 3) and `keypoints` (N x 24 x 3)
+        of each frame of the exercise, or `None` if they have not been computed yet.
+        Only the requested outputs are precomputed.
+        """
+        return self._geometry
+
+    @property
+    def requested_outputs(self):
+        """`set` [`str`]: The outputs that the consumer of `output_fn` needs, out of 'vertices' and 'keypoints'.
+
+        When setting, the geometry is precomputed again if it lacks any of the requested outputs.
+        """
+        return self._requested_outputs
+
+    @requested_outputs.setter
+    def requested_outputs(self, outputs):
+        self._requested_outputs = set(outputs) | {"keypoints"}
+        geometry = self._geometry
+        if geometry is not None and not self._requested_outputs <= set(geometry):
+            self._geometry = None
 
     @property
     def frame_index(self):
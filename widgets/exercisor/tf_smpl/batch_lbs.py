@@ -3,14 +3,19 @@
 @@batch_rodrigues
 @@batch_lrotmin
 @@batch_global_rigid_transformation
+@@batch_regress
+@@batch_blend_transforms
 """
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from .np_lbs import kinematic_levels
+
 
 def batch_skew(vec, batch_size=None):
     """
@@ -115,24 +120,39 @@ def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False):
 
         # Now Js is N x 24 x 3 x 1
         Js = tf.expand_dims(Js, -1)
+        K = Js.shape[1].value
 
         def make_A(R, t, name=None):
-            # Rs is N x 3 x 3, ts is N x 3 x 1
+            # Rs is N x K x 3 x 3, ts is N x K x 3 x 1
             with tf.name_scope(name, "Make_A", [R, t]):
-                R_homo = tf.pad(R, [[0, 0], [0, 1], [0, 0]])
-                t_homo = tf.concat([t, tf.ones([N, 1, 1])], 1)
-                return tf.concat([R_homo, t_homo], 2)
-
-        A0 = make_A(root_rotation, Js[:, 0])
-        results = [A0]
-        for i in range(1, parent.shape[0]):
-            j_here = Js[:, i] - Js[:, parent[i]]
-            A_here = make_A(Rs[:, i], j_here)
-            res_here = tf.matmul(results[parent[i]], A_here, name="propA%d" % i)
-            results.append(res_here)
-
-        # 10 x 24 x 4 x 4
-        results = tf.stack(results, axis=1)
+                R_homo = tf.pad(R, [[0, 0], [0, 0], [0, 1], [0, 0]])
+                t_homo = tf.concat([t, tf.ones([N, K, 1, 1])], 2)
+                return tf.concat([R_homo, t_homo], 3)
+
+        # The local transformation of each joint relative to its parent
+        local_Rs = tf.concat([tf.expand_dims(root_rotation, 1), Rs[:, 1:]], 1)
+        j_here = tf.concat(
+            [Js[:, :1], Js[:, 1:] - tf.gather(Js, parent[1:], axis=1)], 1
+        )
+        A_local = make_A(local_Rs, j_here)
+
+        # The joints at the same depth are transformed together, with
+        # the results kept in the order of the levels
+        levels = kinematic_levels(parent)
+        order = list(levels[0])
+        results = tf.gather(A_local, levels[0], axis=1)
+        for depth, joints in enumerate(levels[1:], 1):
+            parents_here = [order.index(parent[j]) for j in joints]
+            res_here = tf.matmul(
+                tf.gather(results, parents_here, axis=1),
+                tf.gather(A_local, joints, axis=1),
+                name="propA%d" % depth,
+            )
+            results = tf.concat([results, res_here], 1)
+            order.extend(joints)
+
+        # N x 24 x 4 x 4
+        results = tf.gather(results, np.argsort(order), axis=1)
 
         new_J = results[:, :, :3, 3]
 
@@ -147,3 +167,42 @@ def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False):
         A = results - init_bone
 
         return new_J, A
+
+
+def batch_regress(verts, indices, weights, name=None):
+    """
+    Regresses joints from the vertices that the regressor uses,
+    all the coordinates in one step.
+
+    Args:
+      verts: N x V x 3, the vertices
+      indices: K, the vertices that the regressor uses
+      weights: K x J, their weights
+
+    Returns
+      joints : `Tensor`: N x J x 3
+    """
+    with tf.name_scope(name, "batch_regress", [verts, weights]):
+        return tf.einsum("nkc,kj->njc", tf.gather(verts, indices, axis=1), weights)
+
+
+def batch_blend_transforms(A, weights, name=None):
+    """
+    Blends the transformations of the joints that influence each vertex,
+    with a sparse matmul, so neither the weights of each frame nor the
+    gathered transformations of each vertex are materialised.
+
+    Args:
+      A: N x 24 x 4 x 4, relative joint transformations
+      weights: `SparseTensor`: V x 24, the skinning weights, with the joints that influence each vertex
+
+    Returns
+      T : `Tensor`: N x V x 3 x 4 transformation of each vertex
+    """
+    with tf.name_scope(name, "batch_blend_transforms", [A, weights.values]):
+        N, K = tf.shape(A)[0], A.shape[1].value
+        # Only the top 3 rows of the transformations are blended: 24 x N*12
+        A = tf.reshape(tf.transpose(A[:, :, :3, :], [1, 0, 2, 3]), [K, -1])
+        # V x N*12
+        T = tf.sparse.sparse_dense_matmul(weights, A)
+        return tf.transpose(tf.reshape(T, [-1, N, 3, 4]), [1, 0, 2, 3])
@@ -11,76 +11,103 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import pickle as pickle
 
 import tensorflow as tf
-from .batch_lbs import batch_rodrigues, batch_global_rigid_transformation
-
-
-# There are chumpy variables so convert them to numpy.
-def undo_chumpy(x):
-    return x if isinstance(x, np.ndarray) else x.r
+from .batch_lbs import (
+    batch_rodrigues,
+    batch_global_rigid_transformation,
+    batch_regress,
+    batch_blend_transforms,
+)
+from .smpl_params import compress_regressor, load_smpl_params
 
 
 class SMPL(object):
-    def __init__(self, pkl_path, joint_type="cocoplus", dtype=tf.float32):
+    def __init__(
+        self,
+        pkl_path,
+        joint_type="cocoplus",
+        dtype=tf.float32,
+        posedirs_rank=0,
+        skinning_k=0,
+    ):
         """
         pkl_path is the path to a SMPL model
+        The parameters are shared with the other SMPL models of the process.
+        The variables are initialised by feeding the shared parameters,
+        with `initialize`, so the graph holds no copies of them.
+        posedirs_rank, if nonzero, approximates the pose blend shapes with
+        a factorisation of that rank.
+        skinning_k, if nonzero, blends only the transformations of the
+        skinning_k joints that influence each vertex the most.
         """
         # -- Load SMPL params --
-        with open(pkl_path, "rb") as f:
-            dd = pickle.load(f, encoding="latin-1")
+        params = load_smpl_params(pkl_path)
+        self.dtype = dtype
+        self.init_feed_dict = {}
+        self.variables = []
 
         # Mean template vertices
-        self.v_template = tf.Variable(
-            undo_chumpy(dd["v_template"]),
-            name="v_template",
-            dtype=dtype,
-            trainable=False,
-        )
+        self.v_template = self._shared_variable(params.v_template, "v_template")
         # Size of mesh [Number of vertices, 3]
         self.size = [self.v_template.shape[0].value, 3]
-        self.num_betas = dd["shapedirs"].shape[-1]
-        # Shape blend shape basis: 6980 x 3 x 10
-        # reshaped to 6980*30 x 10, transposed to 10x6980*3
-        shapedir = np.reshape(undo_chumpy(dd["shapedirs"]), [-1, self.num_betas]).T
-        self.shapedirs = tf.Variable(
-            shapedir, name="shapedirs", dtype=dtype, trainable=False
-        )
+        self.num_betas = params.shapedirs.shape[0]
+        # Shape blend shape basis: 10 x 6890*3
+        self.shapedirs = self._shared_variable(params.shapedirs, "shapedirs")
 
-        # Regressor for joint locations given shape - 6890 x 24
-        self.J_regressor = tf.Variable(
-            dd["J_regressor"].T.todense(),
-            name="J_regressor",
-            dtype=dtype,
-            trainable=False,
+        # Regressor for joint locations given shape, gathered to the K vertices
+        # that it uses - K x 24
+        self.J_regressor_indices = params.J_regressor_indices
+        self.J_regressor = self._shared_variable(
+            params.J_regressor_weights, "J_regressor"
         )
 
-        # Pose blend shape basis: 6890 x 3 x 207, reshaped to 6890*30 x 207
-        num_pose_basis = dd["posedirs"].shape[-1]
-        # 207 x 20670
-        posedirs = np.reshape(undo_chumpy(dd["posedirs"]), [-1, num_pose_basis]).T
-        self.posedirs = tf.Variable(
-            posedirs, name="posedirs", dtype=dtype, trainable=False
-        )
+        # Pose blend shape basis: 207 x 20670, or its 207 x R and R x 20670 factors
+        if 0 < posedirs_rank < params.posedirs.shape[0]:
+            left, right = params.posedirs_factors(posedirs_rank)
+            self.posedirs = None
+            self.posedirs_factors = (
+                self._shared_variable(left, "posedirs_left"),
+                self._shared_variable(right, "posedirs_right"),
+            )
+        else:
+            self.posedirs = self._shared_variable(params.posedirs, "posedirs")
+            self.posedirs_factors = None
 
         # indices of parents for each joints
-        self.parents = dd["kintree_table"][0].astype(np.int32)
+        self.parents = params.parents
 
-        # LBS weights
-        self.weights = tf.Variable(
-            undo_chumpy(dd["weights"]), name="lbs_weights", dtype=dtype, trainable=False
-        )
+        # LBS weights, or the top k joints of each vertex and their weights
+        # as a sparse 6890 x 24 matrix
+        if 0 < skinning_k < params.weights.shape[1]:
+            indices, weights = params.skinning_topk(skinning_k)
+            # The joints of each vertex in order, as the sparse matrix expects
+            order = np.argsort(indices, axis=1)
+            indices = np.take_along_axis(indices, order, axis=1)
+            weights = np.take_along_axis(weights, order, axis=1)
+            self.weights = None
+            self.skinning_topk = tf.SparseTensor(
+                np.stack(
+                    [np.repeat(np.arange(len(indices)), skinning_k), indices.ravel()],
+                    axis=1,
+                ).astype(np.int64),
+                tf.reshape(self._shared_variable(weights, "lbs_topk_weights"), [-1]),
+                params.weights.shape,
+            )
+        else:
+            self.weights = self._shared_variable(params.weights, "lbs_weights")
+            self.skinning_topk = None
 
-        # This returns 19 keypoints: 6890 x 19
-        self.joint_regressor = tf.Variable(
-            dd["cocoplus_regressor"].T.todense(),
-            name="cocoplus_regressor",
-            dtype=dtype,
-            trainable=False,
-        )
+        # This returns 19 keypoints, gathered to the K vertices that it uses: K x 19
+        self.joint_regressor_indices = params.cocoplus_indices
+        joint_weights = params.cocoplus_weights
         if joint_type == "lsp":  # 14 LSP joints!
-            self.joint_regressor = self.joint_regressor[:, :14]
+            self.joint_regressor_indices, joint_weights = compress_regressor(
+                params.cocoplus_regressor[:, :14]
+            )
+        self.joint_regressor = self._shared_variable(
+            joint_weights, "cocoplus_regressor"
+        )
 
         if joint_type not in ["cocoplus", "lsp"]:
             print(
@@ -91,6 +118,69 @@ class SMPL(object):
 
             ipdb.set_trace()
 
+        self.initializer = tf.compat.v1.variables_initializer(
+            self.variables, name="smpl_init"
+        )
+
+    def _shared_variable(self, value, name):
+        """
+        Create a variable that is initialised by feeding the shared value.
+        """
+        initial_value = tf.compat.v1.placeholder(
+            self.dtype, shape=value.shape, name=name + "_value"
+        )
+        variable = tf.Variable(initial_value, name=name, trainable=False)
+        self.init_feed_dict[initial_value] = value
+        self.variables.append(variable)
+        return variable
+
+    def initialize(self, sess):
+        """
+        Initialise the variables of the model in the session.
+        """
+        sess.run(self.initializer, feed_dict=self.init_feed_dict)
+
+    def _shaped(self, beta):
+        """
+        Returns the shaped template vertices and the rest joints, and records them
+        in self.v_shaped and self.J_rest.
+        """
+        # 1. Add shape blend shapes
+        # (N x 10) x (10 x 6890*3) = N x 6890 x 3
+        v_shaped = (
+            tf.reshape(
+                tf.matmul(beta, self.shapedirs, name="shape_bs"),
+                [-1, self.size[0], self.size[1]],
+            )
+            + self.v_template
+        )
+
+        # 2. Infer shape-dependent joint locations.
+        J = batch_regress(v_shaped, self.J_regressor_indices, self.J_regressor)
+        self.v_shaped, self.J_rest = v_shaped, J
+        return v_shaped, J
+
+    def posed_joints(self, beta, theta, name=None):
+        """
+        Obtain only the 24 SMPL joints with shape (beta) & pose (theta) inputs,
+        with the forward kinematics of the shaped rest joints.
+        The pose blend shapes and the skinning of the mesh are skipped, which do not
+        move these joints, so they are exactly the self.J_transformed of __call__.
+        Args:
+          beta: N x 10
+          theta: N x 72 (with 3-D axis-angle rep)
+
+        Returns:
+          - J_transformed: N x 24 x 3 joint locations
+        """
+        with tf.name_scope(name, "smpl_joints", [beta, theta]):
+            _, J = self._shaped(beta)
+            Rs = tf.reshape(batch_rodrigues(tf.reshape(theta, [-1, 3])), [-1, 24, 3, 3])
+            self.J_transformed, _ = batch_global_rigid_transformation(
+                Rs, J, self.parents
+            )
+            return self.J_transformed
+
     def __call__(self, beta, theta, get_skin=False, name=None):
         """
         Obtain SMPL with shape (beta) & pose (theta) inputs.
@@ -102,6 +192,8 @@ class SMPL(object):
         Updates:
         self.J_transformed: N x 24 x 3 joint location after shaping
                  & posing with beta and theta
+        self.v_shaped, self.J_rest: N x 6890 x 3 and N x 24 x 3, the shaped
+                 template and its joints, which can be fed when beta is unchanged
         Returns:
           - joints: N x 24, N x 19 or 14 x 3 joint locations depending on joint_type
         If get_skin is True, also returns
@@ -111,21 +203,8 @@ class SMPL(object):
         with tf.name_scope(name, "smpl_main", [beta, theta]):
             num_batch = beta.shape[0].value
 
-            # 1. Add shape blend shapes
-            # (N x 10) x (10 x 6890*3) = N x 6890 x 3
-            v_shaped = (
-                tf.reshape(
-                    tf.matmul(beta, self.shapedirs, name="shape_bs"),
-                    [-1, self.size[0], self.size[1]],
-                )
-                + self.v_template
-            )
-
-            # 2. Infer shape-dependent joint locations.
-            Jx = tf.matmul(v_shaped[:, :, 0], self.J_regressor)
-            Jy = tf.matmul(v_shaped[:, :, 1], self.J_regressor)
-            Jz = tf.matmul(v_shaped[:, :, 2], self.J_regressor)
-            J = tf.stack([Jx, Jy, Jz], axis=2)
+            # 1, 2. Add shape blend shapes and infer shape-dependent joint locations.
+            v_shaped, J = self._shaped(beta)
 
             # 3. Add pose blend shapes
             # N x 24 x 3 x 3
@@ -135,12 +214,13 @@ class SMPL(object):
                 pose_feature = tf.reshape(Rs[:, 1:, :, :] - tf.eye(3), [-1, 207])
 
             # (N x 207) x (207, 20670) -> N x 6890 x 3
+            if self.posedirs_factors is None:
+                pose_offsets = tf.matmul(pose_feature, self.posedirs)
+            else:
+                left, right = self.posedirs_factors
+                pose_offsets = tf.matmul(tf.matmul(pose_feature, left), right)
             v_posed = (
-                tf.reshape(
-                    tf.matmul(pose_feature, self.posedirs),
-                    [-1, self.size[0], self.size[1]],
-                )
-                + v_shaped
+                tf.reshape(pose_offsets, [-1, self.size[0], self.size[1]]) + v_shaped
             )
 
             # 4. Get the global joint location
@@ -149,24 +229,34 @@ class SMPL(object):
             )
 
             # 5. Do skinning:
-            # W is N x 6890 x 24
-            W = tf.reshape(tf.tile(self.weights, [num_batch, 1]), [num_batch, -1, 24])
-            # (N x 6890 x 24) x (N x 24 x 16)
-            T = tf.reshape(
-                tf.matmul(W, tf.reshape(A, [num_batch, 24, 16])), [num_batch, -1, 4, 4]
-            )
-            v_posed_homo = tf.concat(
-                [v_posed, tf.ones([num_batch, v_posed.shape[1], 1])], 2
-            )
-            v_homo = tf.matmul(T, tf.expand_dims(v_posed_homo, -1))
+            if self.skinning_topk is None:
+                # W is N x 6890 x 24
+                W = tf.reshape(
+                    tf.tile(self.weights, [num_batch, 1]), [num_batch, -1, 24]
+                )
+                # (N x 6890 x 24) x (N x 24 x 16)
+                T = tf.reshape(
+                    tf.matmul(W, tf.reshape(A, [num_batch, 24, 16])),
+                    [num_batch, -1, 4, 4],
+                )
+                v_posed_homo = tf.concat(
+                    [v_posed, tf.ones([num_batch, v_posed.shape[1], 1])], 2
+                )
+                v_homo = tf.matmul(T, tf.expand_dims(v_posed_homo, -1))
 
-            verts = v_homo[:, :, :3, 0]
+                verts = v_homo[:, :, :3, 0]
+            else:
+                # N x 6890 x 3 x 4, without tiling the weights
+                T = batch_blend_transforms(A, self.skinning_topk)
+                v_posed_homo = tf.concat(
+                    [v_posed, tf.ones([num_batch, v_posed.shape[1], 1])], 2
+                )
+                verts = tf.matmul(T, tf.expand_dims(v_posed_homo, -1))[:, :, :, 0]
 
             # Get cocoplus or lsp joints:
-            joint_x = tf.matmul(verts[:, :, 0], self.joint_regressor)
-            joint_y = tf.matmul(verts[:, :, 1], self.joint_regressor)
-            joint_z = tf.matmul(verts[:, :, 2], self.joint_regressor)
-            joints = tf.stack([joint_x, joint_y, joint_z], axis=2)
+            joints = batch_regress(
+                verts, self.joint_regressor_indices, self.joint_regressor
+            )
 
             if get_skin:
                 return verts, joints, self.J_transformed
@@ -0,0 +1,135 @@
+""" NumPy util functions for SMPL, matching the tensorflow ones of batch_lbs
+@@batch_skew
+@@batch_rodrigues
+@@kinematic_levels
+@@batch_global_rigid_transformation
+@@batch_regress
+@@batch_blend_transforms
+"""
+
+import numpy as np
+
+
+def batch_skew(vec):
+    """
+    vec is N x 3
+
+    returns N x 3 x 3. Skew_sym version of each matrix.
+    """
+    res = np.zeros((vec.shape[0], 3, 3), dtype=vec.dtype)
+    res[:, 0, 1] = -vec[:, 2]
+    res[:, 0, 2] = vec[:, 1]
+    res[:, 1, 0] = vec[:, 2]
+    res[:, 1, 2] = -vec[:, 0]
+    res[:, 2, 0] = -vec[:, 1]
+    res[:, 2, 1] = vec[:, 0]
+    return res
+
+
+def batch_rodrigues(theta):
+    """
+    Theta is N x 3
+    """
+    angle = np.linalg.norm(theta + 1e-8, axis=1)[:, None]
+    r = theta / angle
+
+    angle = angle[:, :, None]
+    cos = np.cos(angle)
+    sin = np.sin(angle)
+
+    outer = r[:, :, None] * r[:, None, :]
+
+    R = cos * np.eye(3, dtype=theta.dtype) + (1 - cos) * outer + sin * batch_skew(r)
+    return R
+
+
+def kinematic_levels(parent):
+    """
+    Groups the joints of the kinematic tree by their depth.
+
+    Args:
+      parent: K holding the parent id for each index, the parents before their children
+
+    Returns
+      levels : list of the joint indices at each depth, starting from the root
+    """
+    depth = np.zeros(len(parent), dtype=np.int32)
+    for i in range(1, len(parent)):
+        depth[i] = depth[parent[i]] + 1
+    return [np.flatnonzero(depth == d) for d in range(depth.max() + 1)]
+
+
+def batch_global_rigid_transformation(Rs, Js, parent):
+    """
+    Computes absolute joint locations given pose.
+
+    Args:
+      Rs: N x 24 x 3 x 3 rotation vector of K joints
+      Js: N x 24 x 3, joint locations before posing
+      parent: 24 holding the parent id for each index
+
+    Returns
+      new_J : N x 24 x 3 location of absolute joints
+      A     : N x 24 4 x 4 relative joint transformations for LBS.
+    """
+    N, K = Rs.shape[:2]
+
+    # The local transformation of each joint relative to its parent
+    local = np.zeros((N, K, 4, 4), dtype=Rs.dtype)
+    local[:, :, :3, :3] = Rs
+    local[:, 0, :3, 3] = Js[:, 0]
+    local[:, 1:, :3, 3] = Js[:, 1:] - Js[:, parent[1:]]
+    local[:, :, 3, 3] = 1
+
+    # The joints at the same depth are transformed together
+    results = np.empty_like(local)
+    results[:, 0] = local[:, 0]
+    for joints in kinematic_levels(parent)[1:]:
+        results[:, joints] = np.matmul(results[:, parent[joints]], local[:, joints])
+
+    new_J = results[:, :, :3, 3]
+
+    # --- Compute relative A: Skinning is based on
+    # how much the bone moved (not the final location of the bone)
+    # but (final_bone - init_bone)
+    # ---
+    init_bone = np.matmul(results[:, :, :3, :3], Js[:, :, :, None])[..., 0]
+    A = results.copy()
+    A[:, :, :3, 3] -= init_bone
+
+    return new_J, A
+
+
+def batch_regress(verts, indices, weights):
+    """
+    Regresses joints from the vertices that the regressor uses,
+    all the coordinates in one step.
+
+    Args:
+      verts: N x V x 3, the vertices
+      indices: K, the vertices that the regressor uses
+      weights: K x J, their weights
+
+    Returns
+      joints : N x J x 3
+    """
+    # (J x K) x (N x K x 3) = N x J x 3
+    return weights.T @ verts[:, indices]
+
+
+def batch_blend_transforms(A, weights):
+    """
+    Blends the transformations of the joints that influence each vertex.
+
+    Args:
+      A: N x 24 x 4 x 4, relative joint transformations
+      weights: V x 24, the skinning weights, sparse with the joints that influence each vertex
+
+    Returns
+      T : N x V x 3 x 4 transformation of each vertex
+    """
+    N, K = A.shape[:2]
+    # Only the top 3 rows of the transformations are blended: 24 x N*12
+    A = A[:, :, :3, :].transpose(1, 0, 2, 3).reshape(K, N * 12)
+    T = (weights @ A).reshape(-1, N, 3, 4)
+    return np.ascontiguousarray(T.transpose(1, 0, 2, 3))
@@ -0,0 +1,200 @@
+"""
+NumPy SMPL implementation as batch, matching the tensorflow one of batch_smpl.
+Specify joint types:
+'coco': Returns COCO+ 19 joints
+'lsp': Returns H3.6M-LSP 14 joints
+Note: To get original smpl joints, use self.J_transformed
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse
+
+from .np_lbs import (
+    batch_rodrigues,
+    batch_global_rigid_transformation,
+    batch_regress,
+    batch_blend_transforms,
+)
+from .smpl_params import compress_regressor, load_smpl_params
+
+
+class NumpySMPL(object):
+    # The number of betas whose shaped template and rest joints are cached
+    shape_cache_size = 8
+
+    def __init__(self, pkl_path, joint_type="cocoplus", posedirs_rank=0, skinning_k=0):
+        """
+        pkl_path is the path to a SMPL model
+        The parameters are shared read-only with the other SMPL models of the process.
+        posedirs_rank, if nonzero, approximates the pose blend shapes with
+        a factorisation of that rank.
+        skinning_k, if nonzero, blends only the transformations of the
+        skinning_k joints that influence each vertex the most.
+        """
+        if joint_type not in ["cocoplus", "lsp"]:
+            raise ValueError(
+                'Unknown joint type: %s, it must be either "cocoplus" or "lsp"'
+                % joint_type
+            )
+
+        params = load_smpl_params(pkl_path)
+        # Mean template vertices
+        self.v_template = params.v_template
+        # Size of mesh [Number of vertices, 3]
+        self.size = [self.v_template.shape[0], 3]
+        self.num_betas = params.shapedirs.shape[0]
+        # Shape blend shape basis: 10 x 6890*3
+        self.shapedirs = params.shapedirs
+        # Regressor for joint locations given shape, gathered to the K vertices
+        # that it uses - K x 24
+        self.J_regressor_indices = params.J_regressor_indices
+        self.J_regressor = params.J_regressor_weights
+        # Pose blend shape basis: 207 x 20670, or its 207 x R and R x 20670 factors
+        self.posedirs = params.posedirs
+        self.posedirs_factors = None
+        if 0 < posedirs_rank < self.posedirs.shape[0]:
+            self.posedirs_factors = params.posedirs_factors(posedirs_rank)
+        # indices of parents for each joints
+        self.parents = params.parents
+        # LBS weights, or the top k joints of each vertex and their weights
+        # as a sparse 6890 x 24 matrix
+        self.weights = params.weights
+        self.skinning_topk = None
+        self._shape_cache = OrderedDict()
+        if 0 < skinning_k < self.weights.shape[1]:
+            indices, weights = params.skinning_topk(skinning_k)
+            self.skinning_topk = scipy.sparse.csr_matrix(
+                (
+                    weights.ravel(),
+                    indices.ravel(),
+                    np.arange(0, indices.size + 1, skinning_k),
+                ),
+                shape=self.weights.shape,
+            )
+        # This returns 19 keypoints, gathered to the K vertices that it uses: K x 19
+        self.joint_regressor_indices = params.cocoplus_indices
+        self.joint_regressor = params.cocoplus_weights
+        if joint_type == "lsp":  # 14 LSP joints!
+            self.joint_regressor_indices, self.joint_regressor = compress_regressor(
+                params.cocoplus_regressor[:, :14]
+            )
+
+    def _shaped(self, beta):
+        """
+        Returns the shaped template vertices and the rest joints of each beta,
+        cached per beta, since the betas are constant across an exercise.
+        When all the betas are the same, a single one is returned for the batch.
+        """
+        unique, inverse = np.unique(beta, axis=0, return_inverse=True)
+        shaped = []
+        for b in unique:
+            key = b.tobytes()
+            if key in self._shape_cache:
+                self._shape_cache.move_to_end(key)
+            else:
+                # (10) x (10 x 6890*3) = 6890 x 3
+                v_shaped = (b @ self.shapedirs).reshape(self.size) + self.v_template
+                # 24 x 3
+                J = batch_regress(
+                    v_shaped[None], self.J_regressor_indices, self.J_regressor
+                )[0]
+                v_shaped.setflags(write=False)
+                J.setflags(write=False)
+                self._shape_cache[key] = (v_shaped, J)
+                if len(self._shape_cache) > self.shape_cache_size:
+                    self._shape_cache.popitem(last=False)
+            shaped.append(self._shape_cache[key])
+
+        v_shaped, J = (np.stack(x) for x in zip(*shaped))
+        if len(unique) == 1:
+            return v_shaped, J
+        inverse = inverse.reshape(-1)
+        return v_shaped[inverse], J[inverse]
+
+    def posed_joints(self, beta, theta):
+        """
+        Obtain only the 24 SMPL joints with shape (beta) & pose (theta) inputs,
+        with the forward kinematics of the shaped rest joints.
+        The pose blend shapes and the skinning of the mesh are skipped, which do not
+        move these joints, so they are exactly the self.J_transformed of __call__.
+        Args:
+          beta: N x 10
+          theta: N x 72 (with 3-D axis-angle rep)
+
+        Returns:
+          - J_transformed: N x 24 x 3 joint locations
+        """
+        beta = np.asarray(beta, dtype=np.float32)
+        theta = np.asarray(theta, dtype=np.float32)
+        num_batch = theta.shape[0]
+
+        _, J = self._shaped(beta)
+        Rs = batch_rodrigues(theta.reshape(-1, 3)).reshape(num_batch, 24, 3, 3)
+        self.J_transformed, _ = batch_global_rigid_transformation(Rs, J, self.parents)
+        return self.J_transformed
+
+    def __call__(self, beta, theta, get_skin=False):
+        """
+        Obtain SMPL with shape (beta) & pose (theta) inputs.
+        Theta includes the global rotation.
+        Args:
+          beta: N x 10
+          theta: N x 72 (with 3-D axis-angle rep)
+
+        Updates:
+        self.J_transformed: N x 24 x 3 joint location after shaping
+                 & posing with beta and theta
+        Returns:
+          - joints: N x 24, N x 19 or 14 x 3 joint locations depending on joint_type
+        If get_skin is True, also returns
+          - Verts: N x 6980 x 3
+        """
+        beta = np.asarray(beta, dtype=np.float32)
+        theta = np.asarray(theta, dtype=np.float32)
+        num_batch = beta.shape[0]
+
+        # 1, 2. Add shape blend shapes and infer shape-dependent joint locations,
+        # or reuse them when the betas are unchanged
+        v_shaped, J = self._shaped(beta)
+
+        # 3. Add pose blend shapes
+        # N x 24 x 3 x 3
+        Rs = batch_rodrigues(theta.reshape(-1, 3)).reshape(num_batch, 24, 3, 3)
+        # Ignore global rotation.
+        pose_feature = (Rs[:, 1:, :, :] - np.eye(3, dtype=np.float32)).reshape(
+            num_batch, 207
+        )
+
+        # (N x 207) x (207, 20670) -> N x 6890 x 3
+        if self.posedirs_factors is None:
+            pose_offsets = pose_feature @ self.posedirs
+        else:
+            left, right = self.posedirs_factors
+            pose_offsets = (pose_feature @ left) @ right
+        v_posed = pose_offsets.reshape(num_batch, self.size[0], self.size[1]) + v_shaped
+
+        # 4. Get the global joint location
+        self.J_transformed, A = batch_global_rigid_transformation(Rs, J, self.parents)
+
+        # 5. Do skinning:
+        if self.skinning_topk is None:
+            # (6890 x 24) x (N x 24 x 16) = N x 6890 x 4 x 4
+            T = (self.weights @ A.reshape(num_batch, 24, 16)).reshape(
+                num_batch, -1, 4, 4
+            )
+        else:
+            # N x 6890 x 3 x 4
+            T = batch_blend_transforms(A, self.skinning_topk)
+        verts = np.einsum("nvij,nvj->nvi", T[:, :, :3, :3], v_posed) + T[:, :, :3, 3]
+
+        # Get cocoplus or lsp joints:
+        joints = batch_regress(
+            verts, self.joint_regressor_indices, self.joint_regressor
+        )
+
+        if get_skin:
+            return verts, joints, self.J_transformed
+        else:
+            return joints
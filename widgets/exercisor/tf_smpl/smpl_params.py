@@ -0,0 +1,210 @@
+"""
+The parameters of the SMPL model, loaded once per model file and shared read-only
+by every SMPL implementation of the process.
+"""
+
+import os
+import pickle as pickle
+import threading
+
+import numpy as np
+
+from ..utils.log import logger
+
+
+# There are chumpy variables so convert them to numpy.
+def undo_chumpy(x):
+    return x if isinstance(x, np.ndarray) else x.r
+
+
+def _read_only(x):
+    """Returns a read-only float32 array of x."""
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    x.setflags(write=False)
+    return x
+
+
+def compress_regressor(regressor):
+    """Returns the vertices that a regressor uses and their weights.
+
+    The joint regressors are overwhelmingly zero, so the joints are regressed
+    from the gathered vertices instead of all of them.
+
+    Parameters
+    ----------
+    regressor : `numpy.ndarray`, (6890 x J)
+        The dense regressor of the J joints given the vertices.
+
+    Returns
+    -------
+    `tuple` [`numpy.ndarray`, `numpy.ndarray`]
+        The K indices of the vertices with a nonzero weight and their (K x J) weights.
+    """
+    indices = np.flatnonzero(np.any(regressor != 0, axis=1)).astype(np.int32)
+    indices.setflags(write=False)
+    return indices, _read_only(regressor[indices])
+
+
+class SMPLParams(object):
+    """The parameters of a SMPL model as read-only float32 arrays.
+
+    Attributes
+    ----------
+    v_template : `numpy.ndarray`, (6890 x 3)
+        The mean template vertices.
+    shapedirs : `numpy.ndarray`, (10 x 20670)
+        The shape blend shape basis, flattened over the vertices' coordinates.
+    J_regressor : `numpy.ndarray`, (6890 x 24)
+        The regressor of the joint locations given the shape.
+    posedirs : `numpy.ndarray`, (207 x 20670)
+        The pose blend shape basis, flattened over the vertices' coordinates.
+    parents : `numpy.ndarray`, (24)
+        The indices of the parent of each joint.
+    weights : `numpy.ndarray`, (6890 x 24)
+        The linear blend skinning weights.
+    cocoplus_regressor : `numpy.ndarray`, (6890 x 19)
+        The regressor of the 19 cocoplus keypoints given the vertices.
+    J_regressor_indices, J_regressor_weights : `numpy.ndarray`, (K), (K x 24)
+        The vertices that the joint regressor uses and their weights.
+    cocoplus_indices, cocoplus_weights : `numpy.ndarray`, (K), (K x 19)
+        The vertices that the cocoplus regressor uses and their weights.
+    """
+
+    def __init__(self, pkl_path):
+        self.pkl_path = pkl_path
+        self._posedirs_svd = None
+        self._lock = threading.Lock()
+        with open(pkl_path, "rb") as f:
+            dd = pickle.load(f, encoding="latin-1")
+
+        self.v_template = _read_only(undo_chumpy(dd["v_template"]))
+        num_betas = dd["shapedirs"].shape[-1]
+        # 6890 x 3 x 10, reshaped to 6890*3 x 10, transposed to 10 x 6890*3
+        self.shapedirs = _read_only(
+            np.reshape(undo_chumpy(dd["shapedirs"]), [-1, num_betas]).T
+        )
+        self.J_regressor = _read_only(dd["J_regressor"].T.todense())
+        # 6890 x 3 x 207, reshaped to 6890*3 x 207, transposed to 207 x 6890*3
+        num_pose_basis = dd["posedirs"].shape[-1]
+        self.posedirs = _read_only(
+            np.reshape(undo_chumpy(dd["posedirs"]), [-1, num_pose_basis]).T
+        )
+        self.parents = dd["kintree_table"][0].astype(np.int32)
+        self.parents.setflags(write=False)
+        self.weights = _read_only(undo_chumpy(dd["weights"]))
+        self.cocoplus_regressor = _read_only(dd["cocoplus_regressor"].T.todense())
+        self.J_regressor_indices, self.J_regressor_weights = compress_regressor(
+            self.J_regressor
+        )
+        self.cocoplus_indices, self.cocoplus_weights = compress_regressor(
+            self.cocoplus_regressor
+        )
+
+    def skinning_topk(self, k):
+        """Returns the k joints that influence each vertex the most and their weights.
+
+        Almost every vertex is influenced by at most four joints, so the skinning
+        blends only the transformations of those joints.
+
+        Parameters
+        ----------
+        k : `int`
+            The number of joints of each vertex.
+
+        Returns
+        -------
+        `tuple` [`numpy.ndarray`, `numpy.ndarray`]
+            The (6890 x k) indices of the joints and their weights, renormalised to sum to 1.
+        """
+        indices = np.argsort(-self.weights, axis=1, kind="stable")[:, :k]
+        weights = np.take_along_axis(self.weights, indices, axis=1)
+        weights = weights / weights.sum(axis=1, keepdims=True)
+        indices = indices.astype(np.int32)
+        indices.setflags(write=False)
+        return indices, _read_only(weights)
+
+    def posedirs_factors(self, rank):
+        """Returns a low-rank factorisation of the pose blend shape basis.
+
+        The truncated SVD of `posedirs`, `posedirs ~ left @ right`, so that the pose blend shapes
+        are computed with two thin matmuls instead of the 207 x 20670 one.
+        The SVD is computed once per model and cached next to it.
+
+        Parameters
+        ----------
+        rank : `int`
+            The rank of the factorisation, at most 207.
+
+        Returns
+        -------
+        `tuple` [`numpy.ndarray`, `numpy.ndarray`]
+            The (207 x rank) left and (rank x 20670) right factors.
+        """
+        with self._lock:
+            if self._posedirs_svd is None:
+                self._posedirs_svd = load_posedirs_svd(self.pkl_path, self.posedirs)
+        U, S, Vt = self._posedirs_svd
+        return _read_only(U[:, :rank] * S[:rank]), _read_only(Vt[:rank])
+
+
+def posedirs_svd_path(pkl_path):
+    """Returns the path of the cached SVD of the pose blend shapes of a SMPL model."""
+    return os.path.splitext(pkl_path)[0] + "_posedirs_svd.npz"
+
+
+def load_posedirs_svd(pkl_path, posedirs):
+    """Load the SVD of the pose blend shapes from the cache or compute and cache it.
+
+    Returns
+    -------
+    `tuple` [`numpy.ndarray`, `numpy.ndarray`, `numpy.ndarray`]
+        The U (207 x 207), S (207) and Vt (207 x 20670) of the SVD.
+    """
+    path = posedirs_svd_path(pkl_path)
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as svd:
+                U, S, Vt = svd["U"], svd["S"], svd["Vt"]
+            if U.shape[0] == posedirs.shape[0] and Vt.shape[1] == posedirs.shape[1]:
+                return U, S, Vt
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning(f"Failed to load the SVD of the pose blend shapes: {err}")
+
+    U, S, Vt = np.linalg.svd(posedirs.astype(np.float64), full_matrices=False)
+    U, S, Vt = (x.astype(np.float32) for x in (U, S, Vt))
+    try:
+        # Write to a temporary file first, so that no partial cache is left
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, U=U, S=S, Vt=Vt)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logger.warning(f"Failed to cache the SVD of the pose blend shapes: {err}")
+    return U, S, Vt
+
+
+_params = {}
+_params_lock = threading.Lock()
+
+
+def load_smpl_params(pkl_path):
+    """Load the parameters of a SMPL model, only the first time that they are requested.
+
+    The model threads load their models concurrently, so the loading is serialised
+    and every consumer gets the same read-only arrays.
+
+    Parameters
+    ----------
+    pkl_path : `str`
+        The path of the SMPL model.
+
+    Returns
+    -------
+    `SMPLParams`
+        The parameters of the model.
+    """
+    key = os.path.abspath(pkl_path)
+    with _params_lock:
+        if key not in _params:
+            _params[key] = SMPLParams(pkl_path)
+        return _params[key]
@@ -0,0 +1,295 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from . import model_cfg
+from .backends import use_per_session_threads
+from .hmr_thread import HMRThread
+from .smpl_thread import SMPLThread
+from .utils.log import logger
+
+AFFINITIES = ("none", "split")
+SMPL_TARGET_FPS = 25
+
+
+class _FrameCounter(object):
+    """Counts the outputs of a model thread."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def _split_cores(smpl_cores):
+    """Returns the cores of the HMR and the SMPL threads, when the last :param: `smpl_cores` cores are given to SMPL."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if len(cpus) <= smpl_cores:
+        return None, None
+    return set(cpus[:-smpl_cores]), set(cpus[-smpl_cores:])
+
+
+def _wait_loaded(threads, timeout):
+    """Wait until the backends of the threads have been loaded."""
+    deadline = time.time() + timeout
+    while any(thread.backend is None for thread in threads):
+        if time.time() > deadline:
+            raise TimeoutError("The models took too long to load")
+        time.sleep(0.1)
+
+
+def measure(
+    source,
+    exercise,
+    hmr_threads,
+    smpl_threads,
+    affinity="none",
+    hmr_backend=None,
+    smpl_backend=None,
+    warmup=3.0,
+    duration=10.0,
+):
+    """Run the HMR and SMPL threads together, as in the Play mode, and measure their frame rates.
+
+    The SMPL thread plays the exercise at its target fps, while the HMR thread predicts as fast as it can,
+    so the HMR frame rate is the end-to-end frame rate of the mirror.
+
+    Parameters
+    ----------
+    source : `str`
+        The capture source of the HMR thread, 'cam' or a video file.
+    exercise : `numpy.ndarray`, (N x 82)
+        The thetas that the SMPL thread plays.
+    hmr_threads : `tuple` [`int`, `int`]
+        The intra-op and inter-op threads of the HMR backend.
+    smpl_threads : `tuple` [`int`, `int`]
+        The intra-op and inter-op threads of the SMPL backend.
+    affinity : `str` { 'none', 'split' }
+        Whether the threads run on any core, or SMPL is pinned to the last core and HMR to the rest.
+    hmr_backend : `str`, optional
+        The HMR backend. Defaults to the thread's default backend.
+    smpl_backend : `str`, optional
+        The SMPL backend. Defaults to the thread's default backend.
+    warmup : `float`
+        The seconds to run before measuring.
+    duration : `float`
+        The seconds of the measurement.
+
+    Returns
+    -------
+    `tuple` [`float`, `float`]
+        The frame rates of the HMR and the SMPL threads.
+    """
+    hmr_cpus, smpl_cpus = None, None
+    if affinity == "split":
+        hmr_cpus, smpl_cpus = _split_cores(1)
+
+    hmr_thread = HMRThread(
+        model_cfg,
+        lambda *args: None,
+        target_fps=1000,
+        backend=hmr_backend,
+        intra_op_threads=hmr_threads[0],
+        inter_op_threads=hmr_threads[1],
+        cpu_affinity=hmr_cpus,
+        # Every frame is predicted, so that the measurement does not depend on the motion in the scene
+        motion_gate=False,
+    )
+    smpl_thread = SMPLThread(
+        model_cfg.smpl_model_path,
+        model_cfg.joint_type,
+        smpl_options=model_cfg.smpl_options,
+        target_fps=SMPL_TARGET_FPS,
+        backend=smpl_backend,
+        intra_op_threads=smpl_threads[0],
+        inter_op_threads=smpl_threads[1],
+        cpu_affinity=smpl_cpus,
+    )
+    threads = (hmr_thread, smpl_thread)
+    hmr_thread.capture = source
+    hmr_thread.requested_outputs = {"joints3d"}
+    smpl_thread.exercise = exercise
+    smpl_thread.frame_index = 0
+
+    counters = [_FrameCounter(), _FrameCounter()]
+    for thread, counter in zip(threads, counters):
+        thread.output_fn = counter
+
+    try:
+        _wait_loaded(threads, timeout=300)
+        for thread in threads:
+            thread.resume()
+
+        time.sleep(warmup)
+        start_counts = [counter.count for counter in counters]
+        start = time.time()
+        time.sleep(duration)
+        elapsed = time.time() - start
+        fps = [
+            (counter.count - count) / elapsed
+            for counter, count in zip(counters, start_counts)
+        ]
+    finally:
+        for thread in threads:
+            thread.stop_exec()
+            thread.resume()
+        for thread in threads:
+            thread.join(timeout=10)
+
+    return tuple(fps)
+
+
+def sweep(
+    source,
+    exercise,
+    hmr_intra,
+    hmr_inter,
+    smpl_intra,
+    smpl_inter,
+    affinities=AFFINITIES,
+    **kwargs,
+):
+    """Measure the frame rates of all the combinations of the thread pools and affinities.
+
+    Some thread pools, like those of the TFLite interpreter and of NumPy, are created once
+    per process, so each combination is measured in a fresh process, as if the mirror started with it.
+    The keyword arguments are passed to :func: `measure`.
+
+    Returns
+    -------
+    `list` [`tuple`]
+        The combinations and their HMR and SMPL frame rates, the best combination first.
+        A combination is ranked by the HMR frame rate, as long as SMPL keeps its target fps.
+    """
+    results = []
+    combinations = list(
+        itertools.product(hmr_intra, hmr_inter, smpl_intra, smpl_inter, affinities)
+    )
+    # Tensorflow is not fork-safe, so the processes are spawned
+    ctx = multiprocessing.get_context("spawn")
+    for i, combination in enumerate(combinations):
+        h_intra, h_inter, s_intra, s_inter, affinity = combination
+        with ctx.Pool(1) as pool:
+            hmr_fps, smpl_fps = pool.apply(
+                measure,
+                (source, exercise, (h_intra, h_inter), (s_intra, s_inter), affinity),
+                kwargs,
+            )
+        logger.info(
+            f"[{i + 1}/{len(combinations)}] HMR threads {h_intra}/{h_inter}, "
+            f"SMPL threads {s_intra}/{s_inter}, affinity {affinity}: "
+            f"HMR {hmr_fps:.1f} fps, SMPL {smpl_fps:.1f} fps"
+        )
+        results.append((combination, hmr_fps, smpl_fps))
+
+    # The combinations where the SMPL playback lags below 95% of its target fps are ranked last
+    results.sort(
+        key=lambda result: (result[2] >= 0.95 * SMPL_TARGET_FPS, result[1]),
+        reverse=True,
+    )
+    return results
+
+
+def _format_cpus(cpus):
+    """Format a set of cores as a CPU list of the settings."""
+    return ",".join(str(cpu) for cpu in sorted(cpus)) if cpus else '""'
+
+
+def main(argv=None):
+    use_per_session_threads()
+    parser = argparse.ArgumentParser(
+        description="Find the thread pools and CPU affinities with the best end-to-end frame rate."
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        default="cam",
+        help="the capture source of HMR, 'cam' or a video longer than each run",
+    )
+    parser.add_argument(
+        "-e",
+        "--exercise",
+        help="the thetas of the exercise played by SMPL (default: the rest pose)",
+    )
+    parser.add_argument(
+        "--hmr-intra",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="the HMR threads per operation",
+    )
+    parser.add_argument(
+        "--hmr-inter",
+        type=int,
+        nargs="+",
+        default=[1, 2],
+        help="the HMR parallel operations",
+    )
+    parser.add_argument(
+        "--smpl-intra",
+        type=int,
+        nargs="+",
+        default=[1, 2],
+        help="the SMPL threads per operation",
+    )
+    parser.add_argument(
+        "--smpl-inter",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="the SMPL parallel operations",
+    )
+    parser.add_argument(
+        "--affinity",
+        choices=AFFINITIES,
+        nargs="+",
+        default=list(AFFINITIES),
+        help="run on any core, or pin SMPL to the last core and HMR to the rest",
+    )
+    parser.add_argument("--hmr-backend", help="the HMR backend")
+    parser.add_argument("--smpl-backend", help="the SMPL backend")
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=10.0,
+        help="the seconds of each measurement",
+    )
+    args = parser.parse_args(argv)
+
+    if args.exercise is not None:
+        exercise = np.load(args.exercise)
+    else:
+        exercise = np.zeros((100, 82), dtype=np.float32)
+
+    results = sweep(
+        args.source,
+        exercise,
+        args.hmr_intra,
+        args.hmr_inter,
+        args.smpl_intra,
+        args.smpl_inter,
+        args.affinity,
+        hmr_backend=args.hmr_backend,
+        smpl_backend=args.smpl_backend,
+        duration=args.duration,
+    )
+
+    (h_intra, h_inter, s_intra, s_inter, affinity), hmr_fps, smpl_fps = results[0]
+    hmr_cpus, smpl_cpus = _split_cores(1) if affinity == "split" else (None, None)
+    logger.info(
+        f"Best: HMR {hmr_fps:.1f} fps, SMPL {smpl_fps:.1f} fps with the settings\n"
+        f"  hmr_intra_op_threads = {h_intra}, hmr_inter_op_threads = {h_inter}, "
+        f"hmr_cpu_affinity = {_format_cpus(hmr_cpus)}\n"
+        f"  smpl_intra_op_threads = {s_intra}, smpl_inter_op_threads = {s_inter}, "
+        f"smpl_cpu_affinity = {_format_cpus(smpl_cpus)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import cv2
+
+
+class MotionGate(object):
+    """Detects the frames where the scene has not changed, so that their prediction can be skipped.
+
+    Each frame is downsampled to a tiny grayscale image and compared with the last frame
+    that was predicted. The scene is unchanged when their mean absolute difference is below
+    the threshold. After :attr: `max_skipped` consecutive skipped frames, the next one is
+    always predicted, so that the outputs are refreshed.
+
+    Attributes
+    ----------
+    threshold : `float`
+        The mean absolute difference, in the range [0, 255], below which the scene is unchanged.
+    size : `tuple` [`int`, `int`]
+        The (width, height) of the downsampled frames.
+    max_skipped : `int`
+        The maximum number of consecutive skipped frames.
+    skipped_frames : `int`
+        The total number of skipped frames.
+    processed_frames : `int`
+        The total number of frames that had to be predicted.
+    """
+
+    def __init__(self, threshold=2.0, size=(32, 24), max_skipped=25):
+        self.threshold = threshold
+        self.size = size
+        self.max_skipped = max_skipped
+        self.skipped_frames = 0
+        self.processed_frames = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the last predicted frame, so that the next frame is always predicted."""
+        self._reference = None
+        self._consecutive_skipped = 0
+
+    def is_unchanged(self, frame):
+        """Returns `True` if the frame can reuse the previous prediction, `False` otherwise.
+
+        Parameters
+        ----------
+        frame : `numpy.ndarray`, (H x W x 3)
+            The BGR image of the frame.
+        """
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if (
+            self._reference is not None
+            and self._consecutive_skipped < self.max_skipped
+            and cv2.absdiff(small, self._reference).mean() < self.threshold
+        ):
+            self._consecutive_skipped += 1
+            self.skipped_frames += 1
+            return True
+
+        # Compare the next frames with this one, so that slow changes are accumulated
+        self._reference = small
+        self._consecutive_skipped = 0
+        self.processed_frames += 1
+        return False
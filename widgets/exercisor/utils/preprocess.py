@@ -66,3 +66,85 @@ def resize_img(img, scale_factor):
         new_size[1] / float(img.shape[1]),
     ]
     return new_img, actual_factor
+
+
+class ImagePreprocessor(object):
+    """Crop, resize and normalize the images into preallocated buffers.
+
+    Produces the same output as :func: `process_image`, but the crop window is computed first
+    and only that region is resampled from the original image, in a single affine warp.
+    The border is replicated only where the crop leaves the image and the normalization
+    is done in place, so no full-size temporaries are allocated for each frame.
+
+    Attributes
+    ----------
+    size : `int`
+        The size of the returned image.
+
+    Notes
+    -----
+    The returned image is a view of the internal buffer, which is overwritten on each call.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._crop = np.empty((size, size, 3), dtype=np.uint8)
+        self._batch = np.empty((1, size, size, 3), dtype=np.float32)
+        self._warp_mat = np.zeros((2, 3), dtype=np.float64)
+
+    def __call__(self, img, center=None, scale=None):
+        """Resize an image by cropping and scaling to size :attr: `size`.
+
+        Parameters
+        ----------
+        img: array_like (N x M x 3)
+            A 2D colored image with color range [0, 255].
+        center: array_like (2), optional
+            The center of the crop in (x, y) image coordinates. Defaults to the image center.
+        scale: float, optional
+            The scale factor of the image. Defaults to fitting the whole image in the crop.
+
+        Returns
+        -------
+        array_like (1 x :attr: size x :attr: size, 3)
+            A 2D image, with 1 batch dimension, of size :attr: size and 3 color channels normalized in range [-1, 1].
+        dict
+            The crop parameters, as returned by :func: `process_image`.
+        """
+        height, width = img.shape[:2]
+        if scale is None:
+            scale = float(self.size) / max(height, width)
+        if center is None:
+            center = np.round(np.array([width, height]) / 2).astype(int)
+
+        # The actual scale factors [x, y] of the resized image, as in :func: `resize_img`
+        scale_factors = np.floor(np.array([width, height]) * scale) / [width, height]
+        center_scaled = np.round(center * scale_factors).astype(int)
+        margin = int(self.size / 2)
+        start_pt = center_scaled - margin
+
+        # Map each pixel of the crop to the original image, following the pixel centers
+        self._warp_mat[0, 0] = 1.0 / scale_factors[0]
+        self._warp_mat[1, 1] = 1.0 / scale_factors[1]
+        self._warp_mat[:, 2] = (start_pt + 0.5) / scale_factors - 0.5
+        cv2.warpAffine(
+            img,
+            self._warp_mat,
+            (self.size, self.size),
+            dst=self._crop,
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+
+        # Normalize image to [-1, 1]
+        np.multiply(self._crop, 2 / 255.0, out=self._batch[0], casting="unsafe")
+        np.subtract(self._batch, 1.0, out=self._batch)
+
+        # Start and end points in the edge-padded image of :func: `scale_and_crop`
+        proc_param = {
+            "scale": scale,
+            "start_pt": start_pt + margin,
+            "end_pt": start_pt + 3 * margin,
+            "img_size": self.size,
+        }
+        return self._batch, proc_param
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def project_joints(joints3d, cam, img_size):
+    """Project the 3D joints on the cropped image with the weak perspective camera of HMR.
+
+    It is the numpy counterpart of the projection in the HMR graph, so that the tracking
+    can run on the 3D joints without fetching the 2D keypoints, which depend on the skinned mesh.
+
+    Parameters
+    ----------
+    joints3d : `numpy.ndarray`, (K x 3)
+        The predicted 3D joints.
+    cam : `numpy.ndarray`, (3)
+        The predicted camera, the scale and the (x, y) translation.
+    img_size : `int`
+        The size of the cropped image.
+
+    Returns
+    -------
+    `numpy.ndarray`, (K x 2)
+        The joints in the pixel coordinates of the cropped image.
+    """
+    joints2d = cam[0] * (joints3d[:, :2] + cam[1:])
+    return ((joints2d + 1) * 0.5) * img_size
+
+
+class CropTracker(object):
+    """Derives the crop window of the next frame from the keypoints of the previous prediction.
+
+    The keypoints' bounding box is rescaled so that the person occupies :attr: `person_size` pixels
+    of the crop, as in the training data of HMR. When the tracking is lost, the whole frame is cropped.
+
+    Attributes
+    ----------
+    img_size : `int`
+        The size of the cropped image.
+    person_size : `float`
+        The size in pixels of the person's bounding box diagonal in the cropped image.
+    min_visible : `float`
+        The minimum fraction of the keypoints that must lie inside the frame to keep tracking.
+    min_person_size : `float`
+        The minimum size in pixels of the person's bounding box diagonal in the frame to keep tracking.
+    smoothing : `float`
+        The weight of the previous crop window in the moving average of the crop window, in range [0, 1).
+    center : `numpy.ndarray`, (2)
+        The center of the next crop in (x, y) frame coordinates, or `None` if the tracking is lost.
+    scale : `float`
+        The scale factor of the next crop, or `None` if the tracking is lost.
+    """
+
+    def __init__(
+        self,
+        img_size,
+        person_size=150.0,
+        min_visible=0.6,
+        min_person_size=40.0,
+        smoothing=0.5,
+    ):
+        self.img_size = img_size
+        self.person_size = person_size
+        self.min_visible = min_visible
+        self.min_person_size = min_person_size
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        """Lose the tracking, so that the next crop is the whole frame."""
+        self.center = None
+        self.scale = None
+
+    def is_tracking(self):
+        """Returns `True` if a person is being tracked, `False` otherwise."""
+        return self.center is not None
+
+    def update(self, joints, proc_param, frame_shape):
+        """Compute the crop window of the next frame.
+
+        Parameters
+        ----------
+        joints : `numpy.ndarray`, (K x 2)
+            The predicted keypoints in the pixel coordinates of the cropped image.
+        proc_param : `dict`
+            The crop parameters of the frame, as returned by the image preprocessing.
+        frame_shape : `tuple`
+            The shape of the frame.
+        """
+        # Map the keypoints from the crop to the frame
+        margin = int(proc_param["img_size"] / 2)
+        start_pt = proc_param["start_pt"] - margin
+        kpnts = (joints + start_pt) / proc_param["scale"]
+
+        height, width = frame_shape[:2]
+        visible = (
+            (kpnts[:, 0] >= 0)
+            & (kpnts[:, 0] < width)
+            & (kpnts[:, 1] >= 0)
+            & (kpnts[:, 1] < height)
+        )
+        if visible.mean() < self.min_visible:
+            self.reset()
+            return
+
+        min_pt = kpnts[visible].min(axis=0)
+        max_pt = kpnts[visible].max(axis=0)
+        person_size = np.linalg.norm(max_pt - min_pt)
+        if person_size < self.min_person_size:
+            self.reset()
+            return
+
+        center = np.clip((min_pt + max_pt) / 2, 0, [width - 1, height - 1])
+        # Never zoom out further than the whole frame
+        scale = max(self.person_size / person_size, self.img_size / max(height, width))
+
+        if self.is_tracking():
+            center = self.smoothing * self.center + (1 - self.smoothing) * center
+            scale = self.smoothing * self.scale + (1 - self.smoothing) * scale
+        self.center, self.scale = center, scale